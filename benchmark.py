@@ -0,0 +1,111 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+
+Replay questions recorded with `run.py --record` through the
+analysis, without a network, and report how long each stage took.
+'''
+
+import argparse
+import asyncio
+import glob
+import logging
+import math
+import os
+import time
+
+from unidecode import unidecode
+
+from herobrain import execution
+from herobrain import localisation
+from herobrain import networking
+from herobrain import search
+from herobrain.analysis import QuestionAnalyser
+from herobrain.cache import PageCache
+from herobrain.recording import Recording, ReplayClient
+
+
+def percentile(values, percent):
+    '''
+    Nearest rank percentile of the values
+    '''
+    values = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+async def replay(recording):
+    networking.set_client(ReplayClient(recording))
+
+    # Nothing should be remembered from the last question
+    search.page_cache = PageCache()
+
+    message = recording.message
+    analyser = QuestionAnalyser(unidecode(message["question"]),
+                                [unidecode(answer["text"]) for answer in message["answers"]],
+                                locale=localisation.get_locale(recording.language))
+
+    start_time = time.perf_counter()
+    updates = []
+
+    def on_update(answers, confidence):
+        # Time until the first provisional prediction
+        if not updates:
+            analyser.trace.add("first", start_time, time.perf_counter())
+        updates.append(confidence)
+
+    await analyser.extract_info()
+    await analyser.find_answers(on_update)
+    analyser.trace.add("total", start_time, time.perf_counter())
+
+    return analyser.trace.stage_times()
+
+
+async def benchmark(recordings, repeat):
+    stage_times = {}
+    start_time = time.perf_counter()
+
+    for _ in range(repeat):
+        for recording in recordings:
+            for stage, seconds in (await replay(recording)).items():
+                stage_times.setdefault(stage, []).append(seconds)
+
+    duration = time.perf_counter() - start_time
+    num_questions = len(recordings) * repeat
+
+    print(f"{'stage':<10} {'p50':>8} {'p95':>8} {'p99':>8}   (ms)")
+    for stage, times in sorted(stage_times.items(), key=lambda item: item[0] == "total"):
+        print(f"{stage:<10} " + " ".join(f"{percentile(times, p) * 1000:>8.1f}" for p in (50, 95, 99)))
+
+    print()
+    print(f"{num_questions} questions in {duration:.2f}s, {num_questions / duration:.2f} questions/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark herobrain against recorded questions")
+    parser.add_argument("recordings", help="Directory of recordings made with run.py --record")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=1, help="Times to replay each question")
+    parser.add_argument("--workers", dest="workers", type=int, default=0, help="Number of analysis worker processes")
+    parser.add_argument("--log-level", dest="log_level", default="warning", choices=["critical", "error", "warning", "info", "debug"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper())
+
+    paths = sorted(glob.glob(os.path.join(args.recordings, "*.json.gz")))
+    if not paths:
+        parser.exit(1, f"No recordings found in {args.recordings}\n")
+    recordings = [Recording.load(path) for path in paths]
+
+    executor = execution.Executor(args.workers, {recording.language for recording in recordings})
+    execution.set_executor(executor)
+    executor.start()
+
+    try:
+        asyncio.get_event_loop().run_until_complete(benchmark(recordings, args.repeat))
+    finally:
+        executor.close()
+
+
+if __name__ == "__main__":
+    main()
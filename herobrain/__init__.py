@@ -6,33 +6,128 @@ Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
 
 import asyncio
 import logging
-import random
 from datetime import datetime, timezone
 
+from herobrain import execution
+from herobrain import localisation
+from herobrain import memory
+from herobrain import metrics
 from herobrain import networking
+from herobrain import recording
+from herobrain import search
+from herobrain import store
 from aiohttp.client_exceptions import ContentTypeError, ClientConnectorError
+from herobrain.cache import PageCache
 from herobrain.game import GameHandler
 from herobrain.output import HQHeroInterface
 
 
-class Herobrain: 
+class Show:
+    '''
+    Follows the shows of one locale, playing each game as it starts
+    '''
     GAME_INFO_PATH = "/shows/now"
 
-    def __init__(self, token, output_addr, quiz_api):
-        self._log = logging.getLogger(Herobrain.__name__)
-        self._log.info("Initialising")
+    # Seconds before a show that connections and language models are warmed up
+    WARM_UP_LEAD = 60
+    # Idle connections are closed after networking.KEEPALIVE_TIMEOUT, so re-warm them more often
+    KEEP_WARM_INTERVAL = 30
+    WARM_UP_TIMEOUT = 5
+    # Connections to google to warm, as each search of a question needs its own
+    GOOGLE_CONNECTIONS = 4
+    # Number of the most used result hosts to warm connections to
+    BUSIEST_HOSTS = 8
 
-        self._interface = HQHeroInterface(output_addr)
+    # Longest to sleep before checking the schedule again, in case it changes
+    MAX_SLEEP = 120
+    POLL_INTERVAL = 2
+    REPORT_INTERVAL = 5
 
-        self._info_api_url = f"{quiz_api}{Herobrain.GAME_INFO_PATH}"
+    def __init__(self, token, output_addr, quiz_api, locale, recorder=None, memory=None):
+        self.locale = locale
+        self._log = logging.getLogger(f"{Show.__name__}[{locale.language}]")
+
+        self._interface = HQHeroInterface(output_addr, locale.language)
+        self._recorder = recorder
+        self._memory = memory
+
+        self._quiz_api = quiz_api
+        self._info_api_url = f"{quiz_api}{Show.GAME_INFO_PATH}"
 
         self._token = token
         self._headers = {"Authorization": f"Bearer {token}",
                          "x-hq-client": "Android/1.5.0"}
                          
         self._event_loop = asyncio.get_event_loop()
+        self._warm_up_job = None
+        self._keep_warm_task = None
+
+    def _warm_up(self):
+        '''
+        Load the language models in the background while
+        we wait for a game, so the first question is fast.
+        Workers tag nouns themselves, so with workers only
+        the stop words are needed here
+        '''
+        if self._warm_up_job is None:
+            self._log.debug("Warming up language models")
+            tagging = not execution.get_executor().is_pooled
+            self._warm_up_job = self._event_loop.run_in_executor(None, self.locale.warm_up, tagging)
+            self._warm_up_job.add_done_callback(self._on_warmed_up)
+
+    def _on_warmed_up(self, job):
+        if job.exception() is not None:
+            self._log.error(f"Could not warm up language models: {job.exception()}")
+            # Try again next time
+            self._warm_up_job = None
+        else:
+            self._log.debug("Language models warm")
+
+    def _warm_urls(self):
+        urls = [networking.origin(self._quiz_api)]
+        urls.extend([networking.origin(self.locale.google_url)] * Show.GOOGLE_CONNECTIONS)
+        urls.extend(networking.origin(url) for url in self.locale.alternate_google_urls)
+
+        result_urls = set(self.locale.common_result_urls)
+        result_urls.update(f"https://{host}/" for host in networking.latencies.busiest(Show.BUSIEST_HOSTS))
+        urls.extend(result_urls)
+
+        return urls
+
+    async def _keep_warm_connections(self):
+        while True:
+            start_time = self._event_loop.time()
+            urls = self._warm_urls()
+            await networking.warm_connections(urls, Show.WARM_UP_TIMEOUT)
+            self._log.debug(f"Warmed {len(urls)} connections in {self._event_loop.time() - start_time:.2f}s")
+
+            await asyncio.sleep(Show.KEEP_WARM_INTERVAL)
+
+    def _keep_warm(self):
+        '''
+        Keep the connections the first question will need open, and
+        the language models loaded, until the game is over
+        '''
+        self._warm_up()
+        if self._keep_warm_task is None or self._keep_warm_task.done():
+            self._log.info("Warming up for the show")
+            self._keep_warm_task = asyncio.ensure_future(self._keep_warm_connections())
+
+    def _stop_keeping_warm(self):
+        if self._keep_warm_task is not None:
+            self._keep_warm_task.cancel()
+            self._keep_warm_task = None
+
+    async def _sleep(self, sleep_time, next_time, prize):
+        while sleep_time > 0:
+            self._interface.report_waiting(next_time, prize)
+            interval = min(sleep_time, Show.REPORT_INTERVAL)
+            sleep_time -= interval
+            await asyncio.sleep(interval)
 
     async def _find_game(self):
+        self._warm_up()
+
         while True:
             try:
                 response_data = await networking.get_json_response(self._info_api_url, timeout=1.5, headers=self._headers)
@@ -66,36 +161,128 @@ class Herobrain:
 
                 self._interface.report_waiting(next_time, prize)
 
-                time_till_show = 0
-                if next_time:
-                    time_till_show = (next_time - datetime.utcnow().replace(tzinfo=timezone.utc)).total_seconds()
-                
-                if time_till_show > 60:
-                    sleep_time = random.randint(60, 120)
-                    self._log.debug("Sleeping")
-
-                    while sleep_time > 0:
-                        self._interface.report_waiting(next_time, prize)
-                        sleep_time -= 5
-                        await asyncio.sleep(5)
+                if next_time is None:
+                    await asyncio.sleep(Show.POLL_INTERVAL)
+                    continue
+
+                time_till_show = (next_time - datetime.utcnow().replace(tzinfo=timezone.utc)).total_seconds()
+                if time_till_show > Show.WARM_UP_LEAD:
+                    # Wake up when it is time to warm up for the show
+                    sleep_time = min(time_till_show - Show.WARM_UP_LEAD, Show.MAX_SLEEP)
+                    self._log.debug(f"Sleeping for {round(sleep_time)}s")
+                    await self._sleep(sleep_time, next_time, prize)
                 else:
-                    await asyncio.sleep(2)
+                    self._keep_warm()
+                    await asyncio.sleep(Show.POLL_INTERVAL)
             else:
                 game_socket_addr = response_data["broadcast"]["socketUrl"].replace("https", "wss")
                 self._log.info("Got a game socket %s" % game_socket_addr)
+
+                # In case we started after the show did
+                self._keep_warm()
                 return game_socket_addr
     
-    async def _main_loop(self):
+    async def play(self):
         while True:
             # Wait for the next game
             game_socket_addr = await self._find_game()
             
             self._interface.report_starting()
             # Play this game
-            game = GameHandler(game_socket_addr, self._headers, self._interface)
-            await game.play()
+            game = GameHandler(game_socket_addr, self._headers, self._interface, self.locale,
+                               self._recorder, self._memory)
+            try:
+                await game.play()
+            finally:
+                self._stop_keeping_warm()
 
             await asyncio.sleep(5)
+
+    async def close(self):
+        await self._interface.close()
+
+
+class Herobrain: 
+    '''
+    Follows the shows of each of the given locales at once, sharing
+    one network pool, cache, store, answer memory, set of workers and loaded
+    language models between them
+
+    Each show uses the token, quiz-api and hqhero of its locale in accounts,
+    a mapping of locale to (token, quiz_api, output_addr), falling back to
+    the ones given for any which are missing or None
+    '''
+
+    def __init__(self, token, output_addr, quiz_api,
+                 locales=(localisation.DEFAULT,),
+                 accounts=None,
+                 workers=execution.DEFAULT_WORKERS,
+                 store_path=None,
+                 store_size=store.DEFAULT_MAX_SIZE,
+                 memory_path=None,
+                 record_path=None,
+                 metrics_port=None):
+        self._log = logging.getLogger(Herobrain.__name__)
+        self._log.info("Initialising")
+
+        # One pooled client is shared by everything this service does
+        if record_path:
+            if len(locales) > 1:
+                raise ValueError("Only the questions of one locale can be recorded at a time")
+
+            self._recorder = recording.RecordingClient(record_path)
+            self._client = self._recorder
+
+            # Every page of every question needs to be fetched to be recorded
+            search.page_cache = PageCache(max_size=0)
+            store_path = None
+            memory_path = None
+        else:
+            self._recorder = None
+            self._client = networking.Client()
+        networking.set_client(self._client)
+
+        # Analysis work is done in worker processes, pre-warmed for every locale
+        self._executor = execution.Executor(workers, locales)
+        execution.set_executor(self._executor)
+        self._executor.start()
+
+        # Keep what we learn between restarts
+        if store_path:
+            search.set_store(store.DiskStore(store_path, max_size=store_size))
+
+        # Questions which are asked again are answered from memory
+        self._memory = None
+        if memory_path:
+            self._memory = memory.AnswerMemory(memory_path)
+
+        # Stage latencies of every question, for prometheus to scrape
+        self._metrics_server = None
+        if metrics_port:
+            self._metrics_server = metrics.MetricsServer(metrics_port)
+
+        accounts = accounts or {}
+        self._shows = []
+        for language in locales:
+            show_token, show_api, show_output = accounts.get(language, (None, None, None))
+            self._shows.append(Show(show_token or token, show_output or output_addr, show_api or quiz_api,
+                                    localisation.get_locale(language), self._recorder, self._memory))
+
+        self._event_loop = asyncio.get_event_loop()
+
+    async def _main_loop(self):
+        if self._metrics_server is not None:
+            await self._metrics_server.start()
+
+        await asyncio.gather(*(show.play() for show in self._shows))
     
     def run(self):
-        self._event_loop.run_until_complete(self._main_loop())
+        try:
+            self._event_loop.run_until_complete(self._main_loop())
+        finally:
+            for show in self._shows:
+                self._event_loop.run_until_complete(show.close())
+            if self._metrics_server is not None:
+                self._event_loop.run_until_complete(self._metrics_server.stop())
+            self._event_loop.run_until_complete(self._client.close())
+            self._executor.close()
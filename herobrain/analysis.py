@@ -6,51 +6,54 @@ Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
 '''
 
 import asyncio
-import itertools
 import logging
 import re
 import time
-from collections import defaultdict
+from functools import partial
 
 from nltk import word_tokenize
-from nltk.tag.perceptron import PerceptronTagger
 from nltk.tokenize import RegexpTokenizer
 
+from herobrain import execution
+from herobrain.deadline import Deadline, QUESTION_SECONDS
 from herobrain import search
 from herobrain import localisation
+from herobrain.counting import PageTotals, TermCounter
+from herobrain.tracing import Trace
 
 log = logging.getLogger(__name__)
 
-PUNCTUATION_TO_NONE = str.maketrans({key: None for key in "!\"#$%&\'()*+,-.:;<=>?@[\\]^_`{|}~�“”"})
-PUNCTUATION_TO_SPACE = str.maketrans({key: " " for key in "!\"#$%&\'()*+,-.:;<=>?@[\\]^_`{|}~�“”"})
+PUNCTUATION_TO_NONE = search.PUNCTUATION_TO_NONE
+PUNCTUATION_TO_SPACE = str.maketrans({key: " " for key in search.PUNCTUATION})
 FIX_QUOTES = str.maketrans("“”", "\"\"")
 
 tokenizer = RegexpTokenizer(r"\w+")
-tagger = PerceptronTagger()
 
 
-def _is_opposite(question):
+def _is_opposite(question, locale):
     '''
     Find out if this question is looking
     for the opposite meaning
 
-    Use the localisation module, as the question
+    Use the question's locale, as the question
     requires different keywords in different countries
     '''
-    return localisation.IS_OPPOSITE_FUNCTION(question)
+    return locale.is_opposite(question)
 
 
-def _find_keywords(words):
+def _find_keywords(words, locale):
     """
     Returns the list of words given without stopwords.
     :param words: List of words
+    :param locale: Locale of the words
     :return: Words without stopwords
     """
-    return [w for w in tokenizer.tokenize(words.lower()) if w not in localisation.STOP_WORDS]
+    stop_words = locale.get_stop_words()
+    return [w for w in tokenizer.tokenize(words.lower()) if w not in stop_words]
 
 
-def _find_nouns(text, num_words, reverse=False):
-    tags = [tag for tag in localisation.TextBlob(text).tags if tag[1] != "POS"]
+def _find_nouns(locale, text, num_words, reverse=False):
+    tags = [tag for tag in locale.get_text_blob()(text).tags if tag[1] != "POS"]
     log.debug(tags)
 
     tags = tags[:num_words] if not reverse else tags[-num_words:]
@@ -74,14 +77,31 @@ def _find_nouns(text, num_words, reverse=False):
     return nouns
 
 
-def _find_q_word_location(question_lower):
-    for q_word in localisation.QUESTION_WORDS:
+def _find_q_word_location(question_lower, locale):
+    for q_word in locale.question_words:
         q_word_location = question_lower.find(q_word)
         if q_word_location != -1:
             return q_word_location
     return 0
 
 
+def parse_answer(answer):
+    # Remove the 's to replace with s as google will not care
+    return answer.replace("'s ", "s ").translate(PUNCTUATION_TO_SPACE).lower()
+
+
+def fingerprint(question, answers):
+    '''
+    Identify a question by its text and set of answers, normalised
+    as they are for analysis, so the question matches when it is asked
+    again with different punctuation or its answers in another order,
+    or in the show of another region
+    '''
+    question = question.translate(FIX_QUOTES).translate(PUNCTUATION_TO_SPACE).lower()
+    answers = sorted({" ".join(parse_answer(answer).split()) for answer in answers})
+    return "\n".join([" ".join(question.split()), *answers])
+
+
 def _generate_probabilities(counts, opposite):
     if opposite:
         for answer in counts:
@@ -103,20 +123,26 @@ def _generate_probabilities(counts, opposite):
     return probabilities
 
 
-def _analysis_method1(texts, answers, opposite):
+def _confidence(probabilities, coverage):
+    '''
+    :param probabilities: Probability of each answer
+    :param coverage: Fraction of the wanted pages which have been read
+    :return: How sure we can be of the most probable answer, from 0 to 1
+    '''
+    best, second = (sorted(probabilities.values(), reverse=True) + [0, 0])[:2]
+    return round((best - second) * min(coverage, 1), 2)
+
+
+def _analysis_method1(question_totals, answers, opposite):
     """
     Returns the answer with the maximum/minimum number of exact occurrences in the texts.
-    :param texts: List of text to analyze
+    :param question_totals: PageTotals of the texts to analyze
     :param answers: List of answers
     :param opposite: True if the best answer occurs the least, False otherwise
     :return: Answer that occurs the most/least in the texts, empty string if there is a tie
     """
-    print("Running method 1")
-    counts = {answer: 0 for answer in answers}
-
-    for text in texts:
-        for answer in counts:
-            counts[answer] += len(re.findall(f" {answer} ", text))
+    log.debug("Running method 1")
+    counts = {answer: question_totals.weigh({answer: 1}) for answer in answers}
 
     log.debug(f"Method 1 counts: {counts}")
     answer_predictions = _generate_probabilities(counts, opposite)
@@ -125,22 +151,16 @@ def _analysis_method1(texts, answers, opposite):
     return answer_predictions
 
 
-def _analysis_method2(texts, answers, reverse):
+def _analysis_method2(question_totals, answer_keywords, reverse):
     """
     Return the answer with the maximum/minimum number of keyword occurrences in the texts.
-    :param texts: List of text to analyze
-    :param answers: List of answers
+    :param question_totals: PageTotals of the texts to analyze
+    :param answer_keywords: Dictionary of answer to the keywords of the answer
     :param reverse: True if the best answer occurs the least, False otherwise
     :return: Answer whose keywords occur most/least in the texts
     """
-    print("Running method 2")
-    counts = {answer: {keyword: 0 for keyword in _find_keywords(answer)} for answer in answers}
-
-    for text in texts:
-        for keyword_counts in counts.values():
-            for keyword in keyword_counts:
-                keyword_counts[keyword] += len(re.findall(f" {keyword} ", text))
-    counts = {answer: sum(keyword_counts.values()) for answer, keyword_counts in counts.items()}
+    log.debug("Running method 2")
+    counts = {answer: question_totals.weigh(dict.fromkeys(keywords, 1)) for answer, keywords in answer_keywords.items()}
 
     log.debug(f"Method 2 counts: {counts}")
     answer_predictions = _generate_probabilities(counts, reverse)
@@ -152,49 +172,30 @@ def _analysis_method2(texts, answers, reverse):
     return answer_predictions
 
 
-def _analysis_method3(answer_text_map, question_keywords, question_key_nouns, answers, reverse):
+def _method3_weights(question_keywords, question_key_nouns):
     """
-    Returns the answer with the maximum number of occurrences of the question keywords in its searches.
+    Returns the weight of each term for method 3.
     :param question_keywords: Keywords of the question
     :param question_key_nouns: Key nouns of the question
-    :param answers: List of answers
+    :return: Dictionary of term to the weight of each occurrence
+    """
+    # Keywords are worth more than nouns
+    weights = dict.fromkeys(question_keywords, 3/4)
+    for noun in question_key_nouns:
+        weights[noun] = weights.get(noun, 0) + 1/4
+
+    return weights
+
+
+def _analysis_method3(answer_totals, term_weights, reverse):
+    """
+    Returns the answer with the maximum number of occurrences of the question keywords in its searches.
+    :param answer_totals: Dictionary of answer to the PageTotals of the texts about that answer
+    :param term_weights: Weight of each term, from _method3_weights
     :param reverse: True if the best answer occurs the least, False otherwise
     :return: Answer whose search results contain the most keywords of the question
     """
-    keyword_scores = {answer: 0 for answer in answers}
-    noun_scores = {answer: 0 for answer in answers}
-
-    # Create a dictionary of word to type of score so we avoid searching for the same thing twice in the same page
-    word_score_map = defaultdict(list)
-    for word in question_keywords:
-        word_score_map[word].append("KW")
-    for word in question_key_nouns:
-        word_score_map[word].append("KN")
-
-    answer_noun_scores_map = {}
-    for answer, texts in answer_text_map.items():
-        keyword_score = 0
-        noun_score = 0
-        noun_score_map = defaultdict(int)
-
-        for text in texts:
-            for keyword, score_types in word_score_map.items():
-                score = len(re.findall(f" {keyword} ", text))
-                if "KW" in score_types:
-                    keyword_score += score
-                if "KN" in score_types:
-                    noun_score += score
-                    noun_score_map[keyword] += score
-
-        keyword_scores[answer] = keyword_score
-        noun_scores[answer] = noun_score
-        answer_noun_scores_map[answer] = noun_score_map
-    
-    summed_scores = {}
-
-    for answer in keyword_scores:
-        # Keywords are worth more than nouns
-        summed_scores[answer] = (keyword_scores[answer] * 3/4) + (noun_scores[answer] * 1/4)
+    summed_scores = {answer: totals.weigh(term_weights) for answer, totals in answer_totals.items()}
     
     prediction = _generate_probabilities(summed_scores, reverse)
 
@@ -204,42 +205,83 @@ def _analysis_method3(answer_text_map, question_keywords, question_key_nouns, an
 class QuestionAnalyser:
     SEARCH_NUMBER = 7
 
-    def __init__(self, question_str, answers):
+    # Stop waiting for pages about the question once this many have arrived
+    QUESTION_PAGE_QUORUM = 5
+    # Longest we wait for pages, after starting to find answers
+    PAGE_DEADLINE = 3.5
+    # Share of the time for pages that a search can take
+    SEARCH_SHARE = 0.6
+    # Seconds kept back, at the end of the question, to score what we have
+    SCORING_TIME = 0.5
+
+    # Publish a provisional prediction once this many pages have been counted
+    PROVISIONAL_PAGES = 3
+    # Seconds between refinements of the provisional prediction
+    REFINE_INTERVAL = 0.25
+
+    # Weight of each method in the prediction, 1 and 2 are
+    # more reliable than 3
+    METHOD_WEIGHTS = (0.75, 0.75, 0.4)
+
+    def __init__(self, question_str, answers, locale=None, trace=None, deadline=None, weights=None):
         self._log = logging.getLogger(QuestionAnalyser.__name__)
+        self.locale = locale or localisation.get_locale()
+        self.trace = trace or Trace()
+        self.deadline = deadline or Deadline(QUESTION_SECONDS)
+        self.weights = weights or QuestionAnalyser.METHOD_WEIGHTS
+
         self._original_answers = answers
         self._question = question_str.translate(FIX_QUOTES)
         self._log.info(f"Question: {self._question}")
         
         self._parsed_answers = []
         self._parsed_answers_to_answer = {}
+        self._answer_keywords = {}
 
         self._is_opposite = False
         self._question_keywords = []
         self._unique_question_keywords =[]
         self._key_nouns = {}
-        self._extract_info()
-
-        self._log.info(self.get_analysis())
-
-    def _extract_info(self):
+        self._page_deadline = None
+        self._counter = None
+
+        # Term counts of each page, by the page's index, as they are counted
+        self._question_totals = PageTotals()
+        self._answer_totals = {}
+        self._method3_weights = {}
+        self._finished = False
+        self._on_update = None
+        self._last_update = 0
+        self.confidence = 0
+
+    async def extract_info(self):
         '''
         Analyse the question, extracting the key
         information, ready to perform a search
         for that information
         '''
+        if self._counter is not None:
+            return
+
+        with self.trace.span("nlp"):
+            await self._extract_info()
+
+        self._log.info(self.get_analysis())
 
+    async def _extract_info(self):
         ### Remove punctuation and other symbols from the answers ####
         self._parsed_answers = []
         for answer in self._original_answers:
-            # Remove the 's to replace with s as google will not care
-            self._parsed_answers.append(answer.replace("'s ", "s ").translate(PUNCTUATION_TO_SPACE).lower())
+            self._parsed_answers.append(parse_answer(answer))
             self._parsed_answers_to_answer[self._parsed_answers[-1]] = answer
         # Remove dupilcates
         self._parsed_answers = list(dict.fromkeys(self._parsed_answers))
+        self._answer_totals = {answer: PageTotals() for answer in self._parsed_answers}
+        self._answer_keywords = {answer: _find_keywords(answer, self.locale) for answer in self._parsed_answers}
 
         
         ### Work out if this queston is actually the opposite ###
-        self._is_opposite = _is_opposite(self._question)
+        self._is_opposite = _is_opposite(self._question, self.locale)
 
         #### Get all words in quotes ####
         question_lower = self._question.lower()
@@ -249,7 +291,7 @@ class QuestionAnalyser:
             no_quote = no_quote.replace(f"\"{quote}\"", "1placeholder1")
         
         #### Extract the keywords from the question ####
-        self._question_keywords = _find_keywords(no_quote)
+        self._question_keywords = _find_keywords(no_quote, self.locale)
         for quote in quoted:
             self._question_keywords[self._question_keywords.index("1placeholder1")] = quote
         
@@ -258,12 +300,11 @@ class QuestionAnalyser:
         #### Extract nouns from the question, if there are no key nouns in the questions ####
         self._key_nouns = set(quoted)
 
-        q_word_location = _find_q_word_location(question_lower)
+        q_word_location = _find_q_word_location(question_lower, self.locale)
         if len(self._key_nouns) == 0:
-            if q_word_location > len(self._question) // 2 or q_word_location == -1:
-                self._key_nouns.update(_find_nouns(self._question, num_words=5))
-            else:
-                self._key_nouns.update(_find_nouns(self._question, num_words=5, reverse=True))
+            # Tagging is slow, so keep it off the event loop
+            reverse = not (q_word_location > len(self._question) // 2 or q_word_location == -1)
+            self._key_nouns.update(await execution.run(_find_nouns, self.locale, self._question, 5, reverse))
 
             self._key_nouns -= {"type"}
 
@@ -272,6 +313,22 @@ class QuestionAnalyser:
                                     " ".join([w for idx, w in enumerate(self._question.split(" ")) if idx != q_word_location])))
         self._key_nouns = {noun.lower() for noun in self._key_nouns}
 
+        self._method3_weights = _method3_weights(self._unique_question_keywords, self._key_nouns)
+        self._counter = self._create_counter()
+
+    def _create_counter(self):
+        '''
+        Create a counter for every term the analysis methods
+        look for, which also decides how deeply pages are indexed
+        '''
+        terms = set(self._parsed_answers)
+        for keywords in self._answer_keywords.values():
+            terms.update(keywords)
+        terms.update(self._unique_question_keywords)
+        terms.update(self._key_nouns)
+
+        return TermCounter(terms, normalise=lambda term: term.translate(PUNCTUATION_TO_NONE))
+
     def get_analysis(self):
         return {
             "nouns": list(self._key_nouns),
@@ -281,53 +338,163 @@ class QuestionAnalyser:
         }
     
     async def _find_texts_about_question(self):
-        search_results = await search.search_google("+".join(self._question_keywords), QuestionAnalyser.SEARCH_NUMBER)
-        return [x.translate(PUNCTUATION_TO_NONE) for x in await search.get_clean_texts(search_results)]
+        with self.trace.span("search"):
+            search_results = await search.search_google("+".join(self._question_keywords),
+                                                        QuestionAnalyser.SEARCH_NUMBER,
+                                                        self.locale,
+                                                        trace=self.trace,
+                                                        deadline=self._search_deadline())
+
+        with self.trace.span("pages"):
+            pages = await search.get_clean_texts(search_results,
+                                                 quorum=QuestionAnalyser.QUESTION_PAGE_QUORUM,
+                                                 deadline=self._page_deadline,
+                                                 trace=self.trace,
+                                                 counter=self._counter,
+                                                 on_counts=partial(self._add_counts, self._question_totals))
+
+        # Methods 1 and 2 are final, whatever the answers are doing
+        self._refine(force=True)
+
+        # Only the counts of the pages are kept
+        return sum(map(len, pages))
+
+    async def _find_texts_about_answer(self, answer):
+        '''
+        Search for, fetch and score the pages about the answer,
+        independently of the other answers
+        :return: Number of words read
+        '''
+        with self.trace.span("search", answer=answer):
+            search_results = await search.search_google(answer,
+                                                        QuestionAnalyser.SEARCH_NUMBER,
+                                                        self.locale,
+                                                        trace=self.trace,
+                                                        deadline=self._search_deadline())
+
+        # A quorum would leave some answers without pages, so only the deadline applies
+        totals = self._answer_totals[answer]
+        with self.trace.span("pages", answer=answer):
+            pages = await search.get_clean_texts(search_results,
+                                                 deadline=self._page_deadline,
+                                                 trace=self.trace,
+                                                 counter=self._counter,
+                                                 on_counts=partial(self._add_counts, totals))
+
+        # This answer's method 3 score is final, whatever the other answers are doing
+        self._log.debug(f"Method 3 score of {answer}: {totals.weigh(self._method3_weights)}")
+        self._refine(force=True)
+
+        return sum(map(len, pages))
+
+    def _search_deadline(self):
+        return self._page_deadline.split(QuestionAnalyser.SEARCH_SHARE)
+
+    def _add_counts(self, totals, index, counts):
+        '''
+        Add the term counts of a page as soon as it has been counted,
+        while the rest of the pages are still downloading
+        '''
+        totals.add(counts)
+        self._refine()
 
-    async def _find_texts_about_answers(self):
-        search_results = await search.multiple_search(self._parsed_answers, QuestionAnalyser.SEARCH_NUMBER)
-        answer_lengths = list(map(len, search_results))
-        search_results = itertools.chain.from_iterable(search_results)
+    def _num_pages_counted(self):
+        return len(self._question_totals) + sum(map(len, self._answer_totals.values()))
 
-        texts = [x.translate(PUNCTUATION_TO_NONE) for x in await search.get_clean_texts(search_results)]
+    def _refine(self, force=False):
+        '''
+        Publish a provisional prediction from the pages counted so far
+        :param force: Publish it even if one was published recently, or few pages have been
+                      counted, as when a search has finished and its scores are final
+        '''
+        if self._on_update is None or self._finished:
+            return
 
-        answer_text_map = {}
-        for idx, length in enumerate(answer_lengths):
-            answer_text_map[self._parsed_answers[idx]] = texts[0:length]
-            del texts[0:length]
-        
-        return answer_text_map
+        num_counted = self._num_pages_counted()
+        now = asyncio.get_event_loop().time()
+        if num_counted == 0 or (not force and (num_counted < QuestionAnalyser.PROVISIONAL_PAGES or
+                                               now - self._last_update < QuestionAnalyser.REFINE_INTERVAL)):
+            return
+        self._last_update = now
+
+        # Provisional scoring is not part of the question's stages
+        with self.trace.span("provisional", pages=num_counted):
+            probs, _ = self._score(Trace())
 
-    async def find_answers(self):
-        # Perform all required searches for information about the question and it's answers
-        searches = [self._find_texts_about_question(), self._find_texts_about_answers()]
-        texts_about_question, texts_about_answers = await asyncio.gather(*searches)
+        self._on_update(probs, self.confidence)
 
-        # Perfrom analysis on web results
+    def _score(self, trace):
+        '''
+        Score the answers on the pages counted so far
+        :param trace: Trace to add the time of each method to
+        :return: Probability of each answer, and the weighting of each method
+        '''
+        # Perfrom analysis on web results, pages are summed as they are counted
+        # so answers which are still arriving are scored on their pages so far
         # Returning a confidence fraction per answer
-        analysis_1 = _analysis_method1(texts_about_question, self._parsed_answers, self._is_opposite)
-        analysis_2 = _analysis_method2(texts_about_question, self._parsed_answers, self._is_opposite)
-        analysis_3 = _analysis_method3(texts_about_answers, 
-                                       self._unique_question_keywords,
-                                       self._key_nouns, 
-                                       self._parsed_answers, 
-                                       self._is_opposite)
+        with trace.span("method1"):
+            analysis_1 = _analysis_method1(self._question_totals, self._parsed_answers, self._is_opposite)
+        with trace.span("method2"):
+            analysis_2 = _analysis_method2(self._question_totals, self._answer_keywords, self._is_opposite)
+        with trace.span("method3"):
+            analysis_3 = _analysis_method3(self._answer_totals, self._method3_weights, self._is_opposite)
+        analyses = (analysis_1, analysis_2, analysis_3)
 
         # Fix the keys for each method which we return as analysis for each method
         methods = []
-        for analysis in (analysis_1, analysis_2, analysis_3):
+        for analysis in analyses:
             methods.append({self._parsed_answers_to_answer[answer]: weighting for answer, weighting in analysis.items()})
 
-        self._log.debug(methods)
-
-        self._log.info(f"Analysed {QuestionAnalyser.SEARCH_NUMBER * 2} pages, Reading {sum(map(len, texts_about_question)) + sum(map(len, texts_about_answers.values()))} words")
-        
-        # Combine the confidence fractions, giving 1 and 2 a higher confience than 3
+        # Combine the confidence fractions of each method by its weight
         combined = {}
-        for answer in analysis_1:
-            combined[self._parsed_answers_to_answer[answer]] = analysis_1[answer] * 0.75 + analysis_2[answer] * 0.75 + analysis_3[answer] * 0.4
+        for answer in self._parsed_answers:
+            combined[self._parsed_answers_to_answer[answer]] = sum(analysis[answer] * weight
+                                                                   for analysis, weight in zip(analyses, self.weights))
         probs = _generate_probabilities(combined, False)
 
+        self.confidence = _confidence(probs, self._num_pages_counted() / self._num_pages_wanted())
+
+        return probs, methods
+
+    def _num_pages_wanted(self):
+        return QuestionAnalyser.QUESTION_PAGE_QUORUM + QuestionAnalyser.SEARCH_NUMBER * len(self._parsed_answers)
+
+    async def find_answers(self, on_update=None):
+        '''
+        Search for the question and its answers, and predict the answer.
+        A prediction is always made before the deadline, from whatever
+        pages have been counted by then.
+        :param on_update: If given, called with the probability of each answer, and the
+                          confidence of the prediction, as the prediction is refined
+                          while pages arrive
+        :return: Probability of each answer, and the weighting of each method
+        '''
+        await self.extract_info()
+
+        # Whatever time the earlier stages took is taken from the time for pages
+        searching_deadline = self.deadline.before(QuestionAnalyser.SCORING_TIME)
+        self._page_deadline = searching_deadline.split(1, limit=QuestionAnalyser.PAGE_DEADLINE)
+        self._on_update = on_update
+
+        # Perform all required searches for information about the question and each of it's answers,
+        # each page is counted as it arrives
+        searches = [self._find_texts_about_question()]
+        searches.extend(self._find_texts_about_answer(answer) for answer in self._parsed_answers)
+        searches = asyncio.gather(*searches)
+        try:
+            num_words = sum(await asyncio.wait_for(searches, searching_deadline.remaining()))
+        except asyncio.TimeoutError:
+            self._log.warning("Out of time, predicting from the pages counted so far")
+            num_words = 0
+        self._finished = True
+
+        with self.trace.span("scoring"):
+            probs, methods = self._score(self.trace)
+
+        self._log.debug(methods)
+
+        self._log.info(f"Analysed {QuestionAnalyser.SEARCH_NUMBER * 2} pages, Reading {num_words} words")
+
         self._log.debug(f"Prediction: ")
         for answer in probs:
             self._log.debug(f" - {answer} - {round(probs[answer] * 100)}%")
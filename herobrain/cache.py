@@ -0,0 +1,131 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+'''
+
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+DEFAULT_TTL = 6 * 60 * 60
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class PageCache:
+    '''
+    A bounded cache of cleaned Pages, keyed by url.
+
+    Entries expire after ttl seconds, and the least recently
+    used entries are evicted once the pages take up more than
+    max_size bytes. Concurrent requests for the same url share
+    a single fetch.
+    '''
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self._log = logging.getLogger(PageCache.__name__)
+
+        self._max_size = max_size
+        self._ttl = ttl
+
+        # url -> (expiry time, text, size)
+        self._entries = OrderedDict()
+        self._size = 0
+
+        self._in_flight = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def _remove(self, url):
+        _, _, size = self._entries.pop(url)
+        self._size -= size
+
+    def get(self, url):
+        '''
+        :return: The cached text of the url, None if it is not cached
+        '''
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+
+        expiry, text, _ = entry
+        if expiry <= time.monotonic():
+            self._remove(url)
+            return None
+
+        self._entries.move_to_end(url)
+        return text
+
+    def put(self, url, text):
+        size = sys.getsizeof(text)
+        if size > self._max_size:
+            return
+
+        if url in self._entries:
+            self._remove(url)
+
+        self._entries[url] = (time.monotonic() + self._ttl, text, size)
+        self._size += size
+
+        while self._size > self._max_size:
+            oldest_url = next(iter(self._entries))
+            self._remove(oldest_url)
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def _on_fetched(self, url, task):
+        del self._in_flight[url]
+
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        # Failed fetches are empty, and are not worth remembering
+        text = task.result()
+        if text:
+            self.put(url, text)
+
+    async def get_or_fetch(self, url, fetch):
+        '''
+        Get the text of the url from the cache, or by awaiting fetch(url).
+
+        If the url is already being fetched, wait for that fetch instead
+        of starting another. The fetch is only cancelled once everything
+        waiting for it has been cancelled.
+        '''
+        text = self.get(url)
+        if text is not None:
+            return text
+
+        flight = self._in_flight.get(url)
+        if flight is None:
+            task = asyncio.ensure_future(fetch(url))
+            flight = _Flight(task)
+            self._in_flight[url] = flight
+            task.add_done_callback(lambda task: self._on_fetched(url, task))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
@@ -0,0 +1,214 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+'''
+
+import sys
+from collections import Counter
+
+
+class Page:
+    '''
+    The words of a page, as a string of token ids.
+
+    Each distinct word of the page is interned once in the page's
+    vocabulary, and every occurrence of it is a character of the
+    tokens whose code point is its id in that vocabulary, so a page
+    takes far less memory than its text and common words are shared
+    by every page which is held, including pages which are
+    unpickled from a worker process.
+    '''
+    __slots__ = ("vocabulary", "tokens")
+
+    # Every id has to be a character
+    MAX_VOCABULARY = sys.maxunicode + 1
+
+    def __init__(self, vocabulary=(), tokens=""):
+        '''
+        :param vocabulary: The distinct words of the page, in order of token id
+        :param tokens: String of the token id of each word of the page, one character per word
+        '''
+        self.vocabulary = list(vocabulary)
+        self.tokens = tokens
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __reduce__(self):
+        # Unpickled words are new strings, so they are interned again
+        return _unpickle_page, (self.vocabulary, self.tokens)
+
+    def __sizeof__(self):
+        # Words may be shared with other pages, but are counted as this page's
+        return (object.__sizeof__(self) + sys.getsizeof(self.tokens) + sys.getsizeof(self.vocabulary) +
+                sum(map(sys.getsizeof, self.vocabulary)))
+
+    def text(self):
+        '''
+        :return: The words of the page separated by single spaces
+        '''
+        return " ".join(map(self.vocabulary.__getitem__, map(ord, self.tokens)))
+
+
+def _unpickle_page(vocabulary, tokens):
+    return Page(map(sys.intern, vocabulary), tokens)
+
+
+class Tokeniser:
+    '''
+    Builds a Page from text as it arrives, giving each
+    new word the next token id of the page's vocabulary
+    '''
+
+    def __init__(self):
+        self._ids = {}
+        self._vocabulary = []
+        self._tokens = []
+
+    def add(self, text):
+        '''
+        :param text: Text made of space separated words, to add to the end of the page
+        '''
+        ids = self._ids
+        vocabulary = self._vocabulary
+
+        tokens = []
+        for word in text.split():
+            token = ids.get(word)
+            if token is None:
+                if len(vocabulary) == Page.MAX_VOCABULARY:
+                    # No id left to give it
+                    continue
+                word = sys.intern(word)
+                token = ids[word] = chr(len(vocabulary))
+                vocabulary.append(word)
+            tokens.append(token)
+
+        self._tokens.append("".join(tokens))
+
+    def close(self):
+        '''
+        :return: The Page of all of the text added
+        '''
+        # Words are only looked up while the page is built
+        self._ids = None
+        return Page(self._vocabulary, "".join(self._tokens))
+
+
+def tokenise(text):
+    '''
+    :param text: Text made of space separated words
+    :return: Page of the words
+    '''
+    tokeniser = Tokeniser()
+    tokeniser.add(text)
+    return tokeniser.close()
+
+
+class PageIndex:
+    '''
+    The term frequencies of a page.
+
+    A term is counted by searching the tokens of the page for the
+    token ids of its words, a single pass over the page in C, rather
+    than matching a pattern against the text of the page.
+    '''
+
+    def __init__(self, page):
+        '''
+        :param page: Page to index
+        '''
+        self.num_words = len(page)
+        self._tokens = page.tokens
+
+        # Terms are looked up by the token ids of their words in this page
+        self._ids = dict(zip(page.vocabulary, map(chr, range(len(page.vocabulary)))))
+
+    def count(self, phrase):
+        '''
+        :param phrase: Tuple of the words of the phrase
+        :return: Number of occurrences of the phrase in the page, which don't overlap
+        '''
+        tokens = tuple(map(self._ids.get, phrase))
+        if not tokens or None in tokens:
+            # A word which isn't in the page
+            return 0
+
+        return self._tokens.count("".join(tokens))
+
+
+class TermCounter:
+    '''
+    Counts the occurrences of many terms in a page.
+
+    Terms are matched as whole words, and are not treated
+    as patterns, so answers like "C++" or "$5" are safe
+    to count.
+    '''
+
+    def __init__(self, terms, normalise=None):
+        '''
+        :param terms: Terms (words or phrases) to count
+        :param normalise: Function applied to each term before it is split into words,
+                          should match the normalisation of the texts being counted
+        '''
+        self._term_phrases = {}
+
+        for term in terms:
+            self._term_phrases[term] = tuple((normalise(term) if normalise else term).split())
+
+    def index(self, page):
+        '''
+        Index the given page for counting
+        :param page: Page to index
+        :return: PageIndex of the page
+        '''
+        return PageIndex(page)
+
+    def count(self, page):
+        '''
+        Count the occurrences of all the terms in the given page
+        :param page: PageIndex of the page
+        :return: Dictionary of term to number of occurrences
+        '''
+        return {term: page.count(phrase) if phrase else 0 for term, phrase in self._term_phrases.items()}
+
+
+class PageTotals:
+    '''
+    The term counts of a set of pages, summed as each page
+    is added, so that scoring the pages takes the same time
+    however many of them there are.
+    '''
+
+    def __init__(self):
+        self.num_pages = 0
+        self._totals = Counter()
+
+    def __len__(self):
+        return self.num_pages
+
+    def add(self, counts):
+        '''
+        :param counts: Dictionary of term to number of occurrences in a page
+        '''
+        self.num_pages += 1
+        self._totals.update(counts)
+
+    def weigh(self, term_weights):
+        '''
+        :param term_weights: Dictionary of term to the weight of each occurrence
+        :return: Weighted sum of the occurrences of the terms in all of the pages
+        '''
+        return sum(self._totals[term] * weight for term, weight in term_weights.items())
+
+
+def count_terms(counter, page):
+    '''
+    Index the given page and count the counter's terms in it
+    :param counter: TermCounter of the terms to count
+    :param page: Page to count the terms in
+    :return: Dictionary of term to number of occurrences
+    '''
+    return counter.count(counter.index(page))
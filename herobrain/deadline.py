@@ -0,0 +1,64 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+'''
+
+import asyncio
+
+# Roughly how long HQ gives to answer a question
+QUESTION_SECONDS = 10
+
+# aiohttp treats a timeout of 0 as no timeout at all
+MIN_TIMEOUT = 0.001
+
+
+class Deadline:
+    '''
+    A time, on the event loop, that some work must be finished by.
+
+    Stages are given a share of the time which is left when they
+    start, so when one stage overruns the stages after it are
+    given less time, and the overall deadline is still kept.
+    '''
+
+    def __init__(self, seconds, parent=None):
+        self._loop = asyncio.get_event_loop()
+        self.end = self._loop.time() + max(seconds, 0)
+        if parent is not None:
+            self.end = min(self.end, parent.end)
+
+    def remaining(self):
+        '''
+        :return: Seconds left until the deadline, 0 if it has passed
+        '''
+        return max(self.end - self._loop.time(), 0)
+
+    def expired(self):
+        return self.remaining() == 0
+
+    def timeout(self, limit):
+        '''
+        :param limit: Longest timeout to give
+        :return: Timeout for a request which must finish by the deadline
+        '''
+        return max(min(limit, self.remaining()), MIN_TIMEOUT)
+
+    def split(self, share, limit=None):
+        '''
+        Give a stage a share of the time which is left
+        :param share: Fraction of the remaining time to give
+        :param limit: Longest the stage can be given, in seconds
+        :return: Deadline of the stage
+        '''
+        seconds = self.remaining() * share
+        if limit is not None:
+            seconds = min(seconds, limit)
+        return Deadline(seconds, parent=self)
+
+    def before(self, seconds):
+        '''
+        :return: Deadline the given seconds before this one,
+                 to keep that time back for the stages after it
+        '''
+        return Deadline(self.remaining() - seconds, parent=self)
@@ -0,0 +1,156 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+'''
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from collections import deque
+
+from herobrain import localisation
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def _init_worker(languages):
+    '''
+    Load everything a worker needs for each language before
+    it is given any work, so the first question is not slower
+    than the rest
+    '''
+    for language in languages:
+        try:
+            localisation.get_locale(language).warm_up()
+        except Exception as e:
+            # A failing initialiser would be restarted by the pool forever
+            log.error(f"Could not warm up worker for {language}: {e}")
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, error):
+    if not future.done():
+        future.set_exception(error)
+
+
+class Executor:
+    '''
+    Runs cpu bound work (html cleaning, noun tagging and
+    page scoring) in a pool of worker processes, so that the
+    event loop stays free to read the game socket and
+    send updates while a question is being analysed.
+
+    With no workers, work is run directly on the event loop.
+    Workers are warmed up for each of the given languages.
+
+    Only as many jobs as there are workers are given to the pool at
+    once, and the rest wait on the event loop, so that the jobs of a
+    cancelled question are dropped before they hold up the next one.
+    '''
+
+    def __init__(self, workers=DEFAULT_WORKERS, languages=(localisation.DEFAULT,)):
+        self._log = logging.getLogger(Executor.__name__)
+        self._workers = workers
+        self._languages = tuple(languages)
+        self._pool = None
+
+        # (future, function, args) of the jobs which are not in the pool yet
+        self._waiting = deque()
+        self._num_running = 0
+
+    @property
+    def is_pooled(self):
+        return self._pool is not None
+
+    def start(self):
+        '''
+        Start the workers up front, so they are warm
+        when the first question arrives
+        '''
+        if self._workers and self._pool is None:
+            self._log.info(f"Starting {self._workers} workers")
+            # concurrent.futures only supports worker initialisers from python 3.7
+            self._pool = multiprocessing.Pool(self._workers,
+                                              initializer=_init_worker,
+                                              initargs=(self._languages,))
+
+    def close(self):
+        if self._pool is not None:
+            self._log.info("Stopping workers")
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+        for future, _, _ in self._waiting:
+            future.cancel()
+        self._waiting.clear()
+        self._num_running = 0
+
+    def _submit(self):
+        '''
+        Give the waiting jobs to the pool while there are
+        free workers, skipping any which have been cancelled
+        '''
+        loop = asyncio.get_event_loop()
+        while self._waiting and self._num_running < self._workers:
+            future, function, args = self._waiting.popleft()
+            if future.done():
+                continue
+
+            self._num_running += 1
+            # Callbacks are called from the pool's result thread
+            self._pool.apply_async(function, args,
+                                   callback=lambda result, future=future:
+                                       loop.call_soon_threadsafe(self._on_done, future, _set_result, result),
+                                   error_callback=lambda error, future=future:
+                                       loop.call_soon_threadsafe(self._on_done, future, _set_exception, error))
+
+    def _on_done(self, future, set_outcome, outcome):
+        self._num_running -= 1
+        set_outcome(future, outcome)
+        if self._pool is not None:
+            self._submit()
+
+    async def run(self, function, *args):
+        '''
+        Run the given function with the given args, returning the result.
+        The function must be defined at module level when running in a pool.
+        '''
+        if self._pool is None:
+            return function(*args)
+
+        future = asyncio.get_event_loop().create_future()
+        self._waiting.append((future, function, args))
+        self._submit()
+        return await future
+
+
+_executor = None
+
+
+def get_executor():
+    '''
+    Get the process wide executor, creating one which
+    runs work on the event loop if none has been set
+    '''
+    global _executor
+    if _executor is None:
+        _executor = Executor(workers=0)
+    return _executor
+
+
+def set_executor(executor):
+    global _executor
+    _executor = executor
+
+
+async def run(function, *args):
+    return await get_executor().run(function, *args)
@@ -9,6 +9,7 @@ import datetime
 import json
 import logging
 import operator
+import random
 import time
 import re
 import socket
@@ -16,14 +17,58 @@ import socket
 import websockets
 from unidecode import unidecode
 
+from herobrain import metrics
 from herobrain import networking
-from herobrain.analysis import QuestionAnalyser
+from herobrain.analysis import QuestionAnalyser, fingerprint
+from herobrain.deadline import Deadline, QUESTION_SECONDS
+from herobrain.tracing import Trace
+
+# Most frames of a show are chat, which we have no use for
+IGNORED_FRAME_TYPES = {"interaction"}
+
+FRAME_TYPE = re.compile(r'"type"\s*:\s*"([^"]*)"')
+# The type is the first field of a frame, so it is only looked for near the start
+FRAME_TYPE_SEARCH_LENGTH = 128
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x1f\x7f-\x9f]")
+
+DECODE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01)
+
+
+def decode_question(message):
+    '''
+    :return: The question of a question message, and its choices
+    '''
+    return unidecode(message["question"]), [unidecode(ans["text"]) for ans in message["answers"]]
+
+
+def frame_type(frame):
+    '''
+    Find the type of a frame without decoding it
+    :return: The type of the frame, None if it could not be found
+    '''
+    match = FRAME_TYPE.search(frame, 0, FRAME_TYPE_SEARCH_LENGTH)
+    return match.group(1) if match else None
 
 
 class GameHandler:
     MORE_LOGS = False
+    # Decode one in this many ignored frames, 0 drops them all
+    IGNORED_SAMPLE_RATE = 0
+    # Low priority events which can wait to be handled before
+    # reading from the socket waits for them
+    LOW_PRIORITY_QUEUE_SIZE = 16
+
+    # Reconnection delays double from the first to the max, with jitter
+    FIRST_RECONNECT_DELAY = 0.1
+    MAX_RECONNECT_DELAY = 2
+    # Seconds without a working connection before the game is given up on
+    RECONNECT_TIMEOUT = 30
+    # A connection which stays open this long is working, even without any messages
+    STABLE_CONNECTION_SECONDS = 10
+    # Reconnections allowed in one game, however long each connection lasted
+    MAX_RECONNECTS = 100
 
-    def __init__(self, socket_addr, headers, interface):
+    def __init__(self, socket_addr, headers, interface, locale, recorder=None, memory=None):
         self._log = logging.getLogger(GameHandler.__name__)
         self._log.info("Initialising on %s" % socket_addr)
 
@@ -31,35 +76,101 @@ class GameHandler:
         self._socket_headers = headers
     
         self._interface = interface
+        self._locale = locale
+        self._recorder = recorder
+        self._memory = memory
         self._event_loop = asyncio.get_event_loop()
+
+        # Fingerprint of the last question asked, known as soon as it
+        # arrives, and the prediction made for it if the analysis finished.
+        # Both are remembered with its answer once the round is over
+        self._last_fingerprint = None
+        self._last_prediction = None
+
+        # Only the latest question is ever analysed, everything
+        # else waits in the queue until no analysis is running
+        self._analysis_task = None
+        self._low_priority_events = asyncio.Queue(maxsize=GameHandler.LOW_PRIORITY_QUEUE_SIZE)
+
+        # Kept across reconnections, so that frames which are
+        # sent again are not handled twice
+        self._question_number = 0
+        self._summarised_questions = set()
+        self._connected_time = None
+        self._disconnected_time = None
+        self._reconnect_attempts = 0
+        self._num_reconnects = 0
     
     async def _on_new_round(self, question, choices, number, num_questions):
         start_time = time.time()
-        self._interface.report_question(question, choices, number, num_questions)
+        trace = Trace()
+        # Everything about this question must be done before players have to answer
+        deadline = Deadline(QUESTION_SECONDS)
 
-        analyser = QuestionAnalyser(question, choices)
-        self._interface.report_analysis(analyser.get_analysis(), number)
+        question_fingerprint = fingerprint(question, choices)
 
-        # Find the probability of answers
-        answers, analysis = await analyser.find_answers()
-        speed = round(time.time() - start_time, 2)
-        
-        self._interface.report_prediction(number, answers, speed, analysis)
+        with trace.span("total"):
+            with trace.span("reporting"):
+                self._interface.report_question(question, choices, number, num_questions)
+
+            remembered = None
+            if self._memory is not None:
+                with trace.span("recalling"):
+                    remembered = await self._memory.recall(question_fingerprint, choices)
+
+            if remembered is not None:
+                self._log.info("Question has been asked before, answering from memory")
+                answers, confidence = remembered
+                analysis = []
+            else:
+                analyser = QuestionAnalyser(question, choices, locale=self._locale, trace=trace, deadline=deadline)
+                await analyser.extract_info()
+                with trace.span("reporting"):
+                    self._interface.report_analysis(analyser.get_analysis(), number)
+
+                def on_update(answers, confidence):
+                    speed = round(time.time() - start_time, 2)
+                    self._interface.report_provisional_prediction(number, answers, confidence, speed)
+
+                # Find the probability of answers, giving a provisional answer while we do
+                answers, analysis = await analyser.find_answers(on_update)
+                confidence = analyser.confidence
+            speed = round(time.time() - start_time, 2)
+
+        self._interface.report_prediction(number, answers, speed, analysis, trace, confidence)
+        metrics.observe_trace(trace)
+
+        self._last_prediction = (answers, confidence)
+        if self._memory is not None:
+            await self._memory.remember(question_fingerprint, answers, confidence)
     
     async def _on_round_complete(self, answer_counts, correct_answer, eliminated, advancing):
         self._interface.report_round_end(answer_counts, correct_answer, eliminated, advancing)
 
+        if self._memory is not None and self._last_fingerprint is not None and correct_answer:
+            # Even if the analysis was cancelled before it made a prediction
+            answers, confidence = self._last_prediction or ({}, 0)
+            await self._memory.remember(self._last_fingerprint, answers, confidence, correct=correct_answer)
+        self._last_fingerprint = None
+        self._last_prediction = None
+
     async def _handle_event(self, message):
         # New question
         if message["type"] == "question":
             # decode the question
-            question_str = unidecode(message["question"])
-            choices = [unidecode(ans["text"]) for ans in message["answers"]]
+            question_str, choices = decode_question(message)
 
             question_num = message['questionNumber']
             num_questions = message['questionCount']
 
-            await self._on_new_round(question_str, choices, question_num, num_questions)
+            if self._recorder is not None:
+                self._recorder.start(message, self._locale.language)
+
+            try:
+                await self._on_new_round(question_str, choices, question_num, num_questions)
+            finally:
+                if self._recorder is not None:
+                    await self._recorder.stop()
         
         # Round is over
         elif message["type"] == "questionSummary":    
@@ -79,6 +190,61 @@ class GameHandler:
         elif message["type"] == "interaction":
             pass
 
+    def _cancel_analysis(self):
+        if self._analysis_task is not None and not self._analysis_task.done():
+            self._log.info("Cancelling the analysis of the last question")
+            self._analysis_task.cancel()
+
+    def _is_repeated(self, message):
+        if message["type"] == "question":
+            # Questions which have been missed are too late to answer
+            if message["questionNumber"] <= self._question_number:
+                return True
+            self._question_number = message["questionNumber"]
+
+        elif message["type"] == "questionSummary" and "questionId" in message:
+            if message["questionId"] in self._summarised_questions:
+                return True
+            self._summarised_questions.add(message["questionId"])
+
+        return False
+
+    async def _schedule_event(self, message):
+        '''
+        Start analysing a new question straight away, cancelling
+        any analysis of the last question with all of its requests,
+        and queue any other event behind it
+        '''
+        if self._is_repeated(message):
+            self._log.debug(f"Ignoring repeated {message['type']}")
+            return
+
+        if message["type"] == "question":
+            self._cancel_analysis()
+            self._last_fingerprint = fingerprint(*decode_question(message))
+            self._last_prediction = None
+            self._analysis_task = asyncio.ensure_future(self._handle_event(message))
+
+        elif message["type"] == "questionSummary":
+            # Too late to answer now
+            self._cancel_analysis()
+            await self._low_priority_events.put(message)
+
+    async def _handle_low_priority_events(self):
+        while True:
+            message = await self._low_priority_events.get()
+
+            # Analysis comes first
+            while self._analysis_task is not None and not self._analysis_task.done():
+                await asyncio.wait([self._analysis_task])
+
+            try:
+                await self._handle_event(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._log.error(f"Could not handle {message['type']}: {e}")
+
     def _is_ending_message(self, message):
         return message["type"] == "broadcastEnded" and "reason" not in message
     
@@ -94,12 +260,32 @@ class GameHandler:
 
     async def _game_connection(self):
         self._log.debug("Starting game connection")
+        frames = metrics.registry.counter("herobrain_frames_total",
+                                          "Number of websocket frames received, by type and if they were decoded")
+        decode_times = metrics.registry.histogram("herobrain_frame_decode_seconds",
+                                                  "Time taken to decode each websocket frame",
+                                                  DECODE_BUCKETS)
+        num_ignored = 0
+
         async with websockets.connect(self._socket_addr, extra_headers=self._socket_headers) as socket:
+            self._on_connected()
             asyncio.ensure_future(self._keep_open(socket))
 
             async for msg in socket:
+                # Drop the frames we don't need before paying to decode them
+                msg_type = frame_type(msg)
+                if msg_type in IGNORED_FRAME_TYPES:
+                    num_ignored += 1
+                    if not GameHandler.IGNORED_SAMPLE_RATE or num_ignored % GameHandler.IGNORED_SAMPLE_RATE:
+                        frames.inc(type=msg_type, decoded="false")
+                        continue
+
                 # We received a new message, remove any weird characters and
-                message_data = json.loads(re.sub(r"[\x00-\x1f\x7f-\x9f]", "", msg))
+                start_time = time.perf_counter()
+                message_data = json.loads(CONTROL_CHARACTERS.sub("", msg))
+                msg_type = message_data.get("type", "unknown")
+                decode_times.observe(time.perf_counter() - start_time, type=msg_type)
+                frames.inc(type=msg_type, decoded="true")
 
                 if GameHandler.MORE_LOGS:
                     self._log.debug(str(message_data))
@@ -109,22 +295,79 @@ class GameHandler:
                     self._log.debug(message_data)
                     raise RuntimeError("Bad token")
 
+                if self._reconnect_attempts:
+                    self._on_connection_working()
+
                 yield message_data
 
+    def _on_connected(self):
+        self._connected_time = self._event_loop.time()
+
+    def _on_connection_working(self):
+        '''
+        Reset the reconnection backoff, once the connection has delivered
+        a message or stayed open, so that a server which accepts and then
+        drops us is still given up on
+        '''
+        if self._disconnected_time is not None:
+            reconnect_time = self._connected_time - self._disconnected_time
+            self._log.info(f"Reconnected after {reconnect_time:.2f}s")
+            metrics.registry.histogram("herobrain_reconnect_seconds",
+                                       "Time from losing the game socket to being connected again").observe(reconnect_time)
+
+        self._disconnected_time = None
+        self._reconnect_attempts = 0
+
+    def _reconnect_delay(self):
+        '''
+        :return: Seconds to wait before reconnecting, None if we have been
+                 disconnected for too long or reconnected too many times
+        '''
+        now = self._event_loop.time()
+        if self._connected_time is not None and now - self._connected_time >= GameHandler.STABLE_CONNECTION_SECONDS:
+            self._on_connection_working()
+        self._connected_time = None
+
+        if self._disconnected_time is None:
+            self._disconnected_time = now
+        elif now - self._disconnected_time > GameHandler.RECONNECT_TIMEOUT:
+            return None
+
+        if self._num_reconnects >= GameHandler.MAX_RECONNECTS:
+            return None
+        self._num_reconnects += 1
+
+        delay = min(GameHandler.FIRST_RECONNECT_DELAY * 2 ** self._reconnect_attempts, GameHandler.MAX_RECONNECT_DELAY)
+        self._reconnect_attempts += 1
+        # Jitter, so shows which drop together don't all reconnect together
+        return delay * random.uniform(0.5, 1)
+
     async def play(self):
+        low_priority_task = asyncio.ensure_future(self._handle_low_priority_events())
         try:
             while True:
-                # Stay in this loop until
-                # we get a connection closed error
-                async for message in self._game_connection():
-                    if self._is_ending_message(message):
-                        self._log.info(f"Game ending: {message}")
-                        return
-                    # Don't stop receiving messages while we wait for the question to be answered
-                    # perform the analysis in another coroutine
-                    asyncio.ensure_future(self._handle_event(message))
-
-        except (websockets.ConnectionClosed, ConnectionResetError):
-            self._log.warning("%s closed unexpectedly" % self._socket_addr)
-        except (ConnectionRefusedError, socket.gaierror) as e:
-            self._log.error("Could not connect to %s: %s" % (self._socket_addr, e))
+                # Stay in this loop until the game ends,
+                # reconnecting straight away if the socket closes
+                try:
+                    async for message in self._game_connection():
+                        if self._is_ending_message(message):
+                            self._log.info(f"Game ending: {message}")
+                            return
+                        # Don't stop receiving messages while we wait for the question to be answered
+                        # perform the analysis in another coroutine
+                        await self._schedule_event(message)
+
+                    self._log.warning("%s closed" % self._socket_addr)
+                except (websockets.ConnectionClosed, ConnectionResetError):
+                    self._log.warning("%s closed unexpectedly" % self._socket_addr)
+                except (ConnectionRefusedError, socket.gaierror, websockets.InvalidHandshake, OSError) as e:
+                    self._log.error("Could not connect to %s: %s" % (self._socket_addr, e))
+
+                delay = self._reconnect_delay()
+                if delay is None:
+                    self._log.error(f"Could not reconnect to {self._socket_addr}, giving up on the game")
+                    return
+
+                await asyncio.sleep(delay)
+        finally:
+            low_priority_task.cancel()
@@ -4,30 +4,72 @@ MIT License
 Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
 '''
 
-from nltk.corpus import stopwords
-from textblob import TextBlob 
-from textblob_de import TextBlobDE
+import threading
+from functools import partial
 
 ENGLISH_US = "en-us"
 ENGLISH_UK = "en-uk"
 GERMANY = "de"
 
 DEFAULT = ENGLISH_UK
-ALL_STOP_WORDS = {"en-uk": set(stopwords.words("english")) - {"most", "least"},
-                  "en-us": set(stopwords.words("english")) - {"most", "least"},
-                  "de": set(stopwords.words("german")) - {"meisten"}}
+
+# Stopwords corpus, and the words in it which are not stop words for us
+ALL_STOP_WORDS = {"en-uk": ("english", frozenset({"most", "least"})),
+                  "en-us": ("english", frozenset({"most", "least"})),
+                  "de": ("german", frozenset({"meisten"}))}
 
 ALL_GOOGLE_URLS = {"en-uk": "https://www.google.co.uk/search?q={}&ie=utf-8&oe=utf-8&client=firefox-b-1-ab",
                    "en-us": "https://www.google.com/search?q={}&ie=utf-8&oe=utf-8&client=firefox-b-1-ab",
                    "de": "https://www.google.de/search?q={}&ie=utf-8&oe=utf-8&client=firefox-b-1-ab"}
 
+# Other google domains which give results in the same language,
+# for hedging searches which are slow to answer
+ALL_ALTERNATE_GOOGLE_URLS = {"en-uk": [ALL_GOOGLE_URLS["en-us"]],
+                             "en-us": [ALL_GOOGLE_URLS["en-uk"]],
+                             "de": ["https://www.google.at/search?q={}&ie=utf-8&oe=utf-8&client=firefox-b-1-ab"]}
+
+# Hosts which answer many questions, worth connecting to before a show
+ALL_COMMON_RESULT_URLS = {"en-uk": ["https://en.wikipedia.org/", "https://www.britannica.com/"],
+                          "en-us": ["https://en.wikipedia.org/", "https://www.britannica.com/"],
+                          "de": ["https://de.wikipedia.org/"]}
+
 ALL_QUESTION_WORDS = {"en-uk": ["what", "when", "who", "which", "whom", "where", "why", "how"],
                       "en-us": ["what", "when", "who", "which", "whom", "where", "why", "how"],
                       "de": ["was", "wann", "wer", "welche", "wem", "wo", "warum", "wie"]}
 
-TEXT_BLOBS = {"en-uk": TextBlob, 
-              "en-us": TextBlob, 
-              "de": TextBlobDE}
+
+def _load_stop_words(corpus, not_stop_words):
+    from nltk.corpus import stopwords
+    return set(stopwords.words(corpus)) - not_stop_words
+
+
+def _load_english_text_blob():
+    from nltk.tag.perceptron import PerceptronTagger
+    from textblob import TextBlob
+    from textblob.base import BaseTagger
+
+    class _PerceptronTagger(BaseTagger):
+        '''
+        TextBlob's default tagger loads the tagger model
+        on every call, so keep one loaded instead
+        '''
+        def __init__(self):
+            self._tagger = PerceptronTagger()
+
+        def tag(self, text, tokenize=True):
+            return self._tagger.tag(text.tokens)
+
+    return partial(TextBlob, pos_tagger=_PerceptronTagger())
+
+
+def _load_german_text_blob():
+    from textblob_de import TextBlobDE
+    return TextBlobDE
+
+
+TEXT_BLOB_LOADERS = {"en-uk": _load_english_text_blob, 
+                     "en-us": _load_english_text_blob, 
+                     "de": _load_german_text_blob}
 
 
 def is_opposite_german(question):
@@ -58,21 +100,68 @@ ALL_OPPOSITE_FUNCTIONS =  {"en-uk": is_opposite_english,
                            "de": is_opposite_german}
 
 
-GOOGLE_URL = ""
-STOP_WORDS = ""
-QUESTION_WORDS = ""
-IS_OPPOSITE_FUNCTION = None
-TextBlob = None
+# Language resources are slow to load, so they are only loaded when
+# a language first needs them, and are shared by every Locale
+_loaded = {}
+# Locales can be warmed up from several threads at once
+_load_lock = threading.Lock()
+
+
+def _load(loader, *args):
+    key = (loader, args)
+    if key not in _loaded:
+        with _load_lock:
+            if key not in _loaded:
+                _loaded[key] = loader(*args)
+    return _loaded[key]
+
+
+class Locale:
+    '''
+    Everything about a language which is needed to analyse its questions.
+
+    A Locale holds no loaded resources itself, so it is cheap to create
+    and to send to worker processes.
+    '''
+
+    def __init__(self, language):
+        self.language = language
+        self.google_url = ALL_GOOGLE_URLS[language]
+        self.alternate_google_urls = ALL_ALTERNATE_GOOGLE_URLS[language]
+        self.common_result_urls = ALL_COMMON_RESULT_URLS[language]
+        self.question_words = ALL_QUESTION_WORDS[language]
+        self.is_opposite = ALL_OPPOSITE_FUNCTIONS[language]
+
+    def get_stop_words(self):
+        return _load(_load_stop_words, *ALL_STOP_WORDS[self.language])
+
+    def get_text_blob(self):
+        '''
+        :return: The TextBlob class of the language
+        '''
+        return _load(TEXT_BLOB_LOADERS[self.language])
+
+    def warm_up(self, tagging=True):
+        '''
+        Load everything the language needs for analysis, so
+        that the first question is not slower than the rest
+        :param tagging: If False, don't load the tagger, for a process which never tags nouns
+        '''
+        self.get_stop_words()
+        if tagging:
+            self.get_text_blob()("Which of these is the first question?").tags
+
+    def __repr__(self):
+        return f"Locale({self.language!r})"
 
 
-def set_as(language):
-    global GOOGLE_URL, STOP_WORDS, QUESTION_WORDS, IS_OPPOSITE_FUNCTION, TextBlob
-    GOOGLE_URL = ALL_GOOGLE_URLS[language]
-    STOP_WORDS = ALL_STOP_WORDS[language]
-    QUESTION_WORDS = ALL_QUESTION_WORDS[language]
-    IS_OPPOSITE_FUNCTION = ALL_OPPOSITE_FUNCTIONS[language]
-    TextBlob = TEXT_BLOBS[language]
+_locales = {}
 
 
-# Default english uk
-set_as(DEFAULT)
+def get_locale(language=DEFAULT):
+    '''
+    :return: The Locale of the language, shared by the whole process
+    '''
+    if language not in _locales:
+        _locales[language] = Locale(language)
+    return _locales[language]
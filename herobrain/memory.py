@@ -0,0 +1,81 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+'''
+
+import asyncio
+import json
+import logging
+
+from herobrain.analysis import parse_answer
+from herobrain.store import DiskStore
+
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+# Questions are asked again months later
+DEFAULT_TTL = 365 * 24 * 60 * 60
+
+
+class AnswerMemory:
+    '''
+    Remembers the prediction made for each question, and the answer
+    it turned out to have, between shows and restarts.
+
+    Questions are kept by their fingerprint, so that a question which
+    is asked again can be answered without searching for it.
+    '''
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self._log = logging.getLogger(AnswerMemory.__name__)
+        self._store = DiskStore(path, max_size=max_size, ttl=ttl)
+
+    def __len__(self):
+        return len(self._store)
+
+    async def recall(self, fingerprint, answers):
+        '''
+        :param fingerprint: Fingerprint of the question
+        :param answers: Answers of the question, as they are given this time
+        :return: Probability of each answer and the confidence of the prediction,
+                 None if the question has not been asked before
+        '''
+        # Reading decompresses the value from disk, so keep it off the event loop
+        value = await asyncio.get_event_loop().run_in_executor(None, self._store.get, fingerprint)
+        if value is None:
+            return None
+
+        try:
+            remembered = json.loads(value)
+        except ValueError as e:
+            self._log.error(f"Could not read remembered question: {e}")
+            return None
+
+        parsed_answers = {answer: parse_answer(answer) for answer in answers}
+
+        correct = remembered["correct"]
+        if correct is not None and correct in parsed_answers.values():
+            return {answer: float(parsed == correct) for answer, parsed in parsed_answers.items()}, 1
+
+        prediction = remembered["prediction"]
+        return ({answer: prediction.get(parsed, 0) for answer, parsed in parsed_answers.items()},
+                remembered["confidence"])
+
+    async def remember(self, fingerprint, prediction, confidence, correct=None):
+        '''
+        :param fingerprint: Fingerprint of the question
+        :param prediction: Probability of each answer
+        :param confidence: Confidence of the prediction
+        :param correct: The correct answer, if it is known
+        '''
+        value = json.dumps({"prediction": {parse_answer(answer): probability
+                                           for answer, probability in prediction.items()},
+                            "confidence": confidence,
+                            "correct": parse_answer(correct) if correct else None})
+
+        try:
+            # Writing compresses the value, so keep it off the event loop
+            await asyncio.get_event_loop().run_in_executor(None, self._store.put, fingerprint, value)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._log.error(f"Could not remember question: {e}")
@@ -0,0 +1,156 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+
+Metrics of how herobrain is performing, which can be
+scraped in the prometheus text format.
+'''
+
+import logging
+from collections import defaultdict
+
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 8 * 1024, 32 * 1024, 128 * 1024, 512 * 1024, 2 * 1024 * 1024)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        self._values[tuple(sorted(labels.items()))] += amount
+
+    def get(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self._buckets = tuple(buckets)
+        # labels -> [count per bucket..., sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        values = self._values.get(key)
+        if values is None:
+            values = self._values[key] = [0] * (len(self._buckets) + 2)
+
+        for i, bucket in enumerate(self._buckets):
+            if value <= bucket:
+                values[i] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def count(self, **labels):
+        values = self._values.get(tuple(sorted(labels.items())))
+        return values[-1] if values else 0
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, values in self._values.items():
+            for bucket, count in zip(self._buckets, values):
+                lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', bucket)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {values[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _get(self, metric_class, name, *args):
+        if name not in self._metrics:
+            self._metrics[name] = metric_class(name, *args)
+        return self._metrics[name]
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of the whole process
+registry = Registry()
+
+
+def observe_trace(trace):
+    '''
+    Add the timings of a question's trace to the metrics
+    '''
+    stages = registry.histogram("herobrain_stage_seconds", "Time taken by each stage of answering a question")
+    for stage, seconds in trace.stage_times().items():
+        stages.observe(seconds, stage=stage)
+
+    spans = registry.histogram("herobrain_span_seconds", "Time taken by each span of answering a question")
+    fetches = registry.counter("herobrain_fetches_total", "Number of requests made, by status")
+    fetch_bytes = registry.histogram("herobrain_fetch_bytes", "Number of bytes read per request", SIZE_BUCKETS)
+
+    for span in trace.spans:
+        spans.observe(span["duration"], stage=span["stage"])
+
+        if span["stage"] == "fetch":
+            fetches.inc(status=span.get("status") or span.get("error", "unknown"))
+            fetch_bytes.observe(span.get("bytes", 0))
+
+
+class MetricsServer:
+    '''
+    Serves the metrics of the registry on /metrics
+    '''
+    PATH = "/metrics"
+
+    def __init__(self, port, host="0.0.0.0", metrics_registry=registry):
+        self._log = logging.getLogger(MetricsServer.__name__)
+        self._host = host
+        self._port = port
+        self._registry = metrics_registry
+        self._runner = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self._registry.expose(), content_type="text/plain")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get(MetricsServer.PATH, self._handle_metrics)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        self._log.info(f"Serving metrics on {self._host}:{self._port}{MetricsServer.PATH}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -5,40 +5,446 @@ Copyright (c) 2018 Kevin Wu <github.com/Exaphis>
 '''
 
 import asyncio
+import codecs
 import json
 import logging
 import re
+import time
+from collections import Counter, defaultdict, deque
+from functools import partial
+from urllib.parse import urlsplit
 
 import aiohttp
 from unidecode import unidecode
 
 log = logging.getLogger(__name__)
 
-async def fetch(url, session, timeout):
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 8
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+
+READ_CHUNK_SIZE = 16 * 1024
+
+# A hedged request is duplicated once it takes longer than
+# this fraction of the host's recent requests
+HEDGE_QUANTILE = 0.9
+# Until a host has answered this many requests, hedge after the default delay
+HEDGE_MIN_SAMPLES = 10
+DEFAULT_HEDGE_DELAY = 1
+MIN_HEDGE_DELAY = 0.05
+
+
+class Client:
+    '''
+    A long lived, pooled http client.
+
+    Connections are kept alive between requests and
+    DNS lookups are cached, so that the hot path of a
+    question does not pay for connection setup to google
+    and every result host.
+    '''
+    # Slow requests are also sent to their alternate urls
+    HEDGE = True
+
+    def __init__(self,
+                 limit=CONNECTION_LIMIT,
+                 limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                 dns_cache_ttl=DNS_CACHE_TTL,
+                 keepalive_timeout=KEEPALIVE_TIMEOUT):
+        self._log = logging.getLogger(Client.__name__)
+
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._dns_cache_ttl = dns_cache_ttl
+        self._keepalive_timeout = keepalive_timeout
+
+        self._session = None
+
+    def _create_session(self):
+        try:
+            # Uses aiodns, so lookups don't block a thread
+            resolver = aiohttp.AsyncResolver()
+        except RuntimeError:
+            self._log.warning("aiodns is not available, using the default resolver")
+            resolver = aiohttp.DefaultResolver()
+
+        connector = aiohttp.TCPConnector(limit=self._limit,
+                                         limit_per_host=self._limit_per_host,
+                                         use_dns_cache=True,
+                                         ttl_dns_cache=self._dns_cache_ttl,
+                                         keepalive_timeout=self._keepalive_timeout,
+                                         resolver=resolver)
+        return aiohttp.ClientSession(connector=connector)
+
+    def _discard_session(self):
+        '''
+        Close the connections of a session which was opened on another
+        event loop, as its close can't be awaited from this one
+        '''
+        connector = self._session.connector
+        self._session.detach()
+        if connector is None:
+            return
+
+        try:
+            connector.close()
+        except RuntimeError as e:
+            # The loop has been closed, and its connections with it
+            self._log.debug(f"Could not close the connections of the last session: {e}")
+
+    @property
+    def session(self):
+        # A session can only be used on the loop it was opened on
+        if (self._session is None or self._session.closed or
+                self._session._loop is not asyncio.get_event_loop()):
+            if self._session is not None and not self._session.closed:
+                self._discard_session()
+
+            self._log.debug("Opening session")
+            self._session = self._create_session()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            self._log.debug("Closing session")
+            await self._session.close()
+            # Give the underlying SSL connections time to close
+            await asyncio.sleep(0.25)
+        self._session = None
+
+
+_client = None
+
+
+class HostLatencies:
+    '''
+    The recent response times of each host,
+    for deciding when to hedge a request to it
+    '''
+    WINDOW = 100
+
+    def __init__(self):
+        self._times = defaultdict(lambda: deque(maxlen=HostLatencies.WINDOW))
+        self._counts = Counter()
+
+    def add(self, url, seconds):
+        host = urlsplit(url).hostname
+        self._times[host].append(seconds)
+        self._counts[host] += 1
+
+    def busiest(self, num_hosts):
+        '''
+        :return: The hosts which have answered the most requests
+        '''
+        return [host for host, _ in self._counts.most_common(num_hosts)]
+
+    def quantile(self, url, fraction):
+        '''
+        :return: The fraction quantile of the host's response times,
+                 None if it has not answered enough requests
+        '''
+        times = self._times.get(urlsplit(url).hostname)
+        if not times or len(times) < HEDGE_MIN_SAMPLES:
+            return None
+
+        times = sorted(times)
+        return times[min(int(fraction * len(times)), len(times) - 1)]
+
+    def hedge_delay(self, url):
+        delay = self.quantile(url, HEDGE_QUANTILE)
+        if delay is None:
+            return DEFAULT_HEDGE_DELAY
+        return max(delay, MIN_HEDGE_DELAY)
+
+
+# Response times of every host this process has fetched from
+latencies = HostLatencies()
+
+
+def origin(url):
+    '''
+    :return: The root url of the url's host
+    '''
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/"
+
+
+def get_client():
+    '''
+    Get the process wide client, creating one
+    if no client has been set
+    '''
+    global _client
+    if _client is None:
+        _client = Client()
+    return _client
+
+
+def set_client(client):
+    global _client
+    _client = client
+
+
+async def _read_into(response, extractor, max_bytes):
+    '''
+    Stream the body of the response into the extractor,
+    stopping after max_bytes have been read.
+    Returns what the extractor returns, and the number of bytes read
+    '''
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    num_bytes = 0
+    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+        if max_bytes is not None and num_bytes + len(chunk) >= max_bytes:
+            extractor.feed(decoder.decode(chunk[:max_bytes - num_bytes]))
+            num_bytes = max_bytes
+            log.debug(f"Stopped reading {response.url} after {max_bytes} bytes")
+            break
+
+        num_bytes += len(chunk)
+        extractor.feed(decoder.decode(chunk))
+
+    extractor.feed(decoder.decode(b"", final=True))
+    return extractor.close(), num_bytes
+
+
+class _TextBuffer:
+    def __init__(self):
+        self._parts = []
+
+    def feed(self, data):
+        self._parts.append(data)
+
+    def close(self):
+        return "".join(self._parts)
+
+
+async def fetch(url, session, timeout, headers=None, extractor=None, max_bytes=None, trace=None):
+    '''
+    Get the text of the given url, returning empty if the request fails.
+
+    If an extractor (a callable returning an object with feed and close
+    methods) is given, the body is streamed into a new extractor, and what
+    it returns on close is returned instead. If max_bytes is given, only
+    that much of the body is read.
+
+    If a trace is given, the request is added to it as a fetch span.
+    '''
+    start_time = time.perf_counter()
+    info = {"url": str(url), "status": None, "bytes": 0}
     try:
-        async with session.get(url, timeout=timeout) as response:
-            return await response.text()
+        async with session.get(url, timeout=timeout, headers=headers) as response:
+            info["status"] = response.status
+
+            if extractor is None and max_bytes is None:
+                # The body is kept by the response, so decoding it doesn't read it again
+                info["bytes"] = len(await response.read())
+                result = await response.text()
+            else:
+                result, info["bytes"] = await _read_into(response, (extractor or _TextBuffer)(), max_bytes)
+
+            if response.status < 400:
+                latencies.add(str(url), time.perf_counter() - start_time)
+            return result
+    except asyncio.CancelledError:
+        # Before python 3.8 this is an Exception, and must not be swallowed
+        info["error"] = "cancelled"
+        raise
     except Exception as e:
+        info["error"] = type(e).__name__
         log.error(f"Server timeout/error {url}: {e}")
         return ""
+    finally:
+        if trace is not None:
+            trace.add("fetch", start_time, time.perf_counter(), **info)
+
+
+async def hedge(fetches, delay, deadline=None):
+    '''
+    Start the first of the given fetches (functions returning a response coroutine),
+    and start the next whenever nothing has arrived after the delay, or a fetch fails.
+    The first non-empty response is returned, and the other fetches are cancelled.
+
+    If a Deadline is given, the fetches are cancelled when it passes and empty is returned.
+    '''
+    fetches = list(fetches)
+    pending = set()
+    try:
+        while fetches or pending:
+            if deadline is not None and deadline.expired():
+                log.debug("Gave up on a hedged request at its deadline")
+                break
+
+            timeout = None
+            if fetches:
+                pending.add(asyncio.ensure_future(fetches.pop(0)()))
+                timeout = delay
+            if deadline is not None:
+                timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result():
+                    return task.result()
+
+            if not done and fetches:
+                log.debug(f"Hedging a request after {delay:.2f}s")
+        return ""
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _fetch_and_process(url, session, timeout, headers, extractor, max_bytes, process, trace, hedge_urls=None,
+                             deadline=None):
+    if hedge_urls:
+        def start_fetch(hedge_url):
+            # Each copy only gets the time left before the deadline when it starts
+            return fetch(hedge_url, session, deadline.timeout(timeout) if deadline is not None else timeout,
+                         headers, extractor, max_bytes, trace)
+
+        response = await hedge([partial(start_fetch, hedge_url) for hedge_url in [url] + list(hedge_urls)],
+                               latencies.hedge_delay(url), deadline)
+    else:
+        response = await fetch(url, session, timeout, headers, extractor, max_bytes, trace)
+    if not response or process is None:
+        return response
+
+    try:
+        return await process(response)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log.error(f"Could not process response from {url}: {e}")
+        return ""
+
+
+def _on_task_done(on_response, index, task):
+    if not task.cancelled() and task.exception() is None and task.result():
+        on_response(index, task.result())
+
+
+async def gather_responses(coroutines, quorum=None, deadline=None, on_response=None):
+    '''
+    Run all of the given response coroutines at once,
+    returning their responses in order.
+
+    If a quorum is given, return as soon as that many
+    responses have arrived. If a Deadline is given, return
+    whatever has arrived by then. Coroutines
+    which have not finished are cancelled and their
+    response is returned as empty.
+
+    If on_response is given, it is called with the index and
+    response of each non-empty response as soon as it arrives.
+    '''
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+
+    if on_response is not None:
+        for index, task in enumerate(tasks):
+            task.add_done_callback(partial(_on_task_done, on_response, index))
+
+    if quorum is None and deadline is None:
+        return await asyncio.gather(*tasks)
+
+    pending = set(tasks)
+    num_arrived = 0
+
+    try:
+        while pending and (quorum is None or num_arrived < quorum):
+            wait_time = None
+            if deadline is not None:
+                wait_time = deadline.remaining()
+                if wait_time <= 0:
+                    break
+
+            done, pending = await asyncio.wait(pending, timeout=wait_time, return_when=asyncio.FIRST_COMPLETED)
+            # Failed requests return empty, so they don't count towards the quorum
+            num_arrived += sum(1 for task in done if task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if pending:
+        log.debug(f"Cancelled {len(pending)} of {len(tasks)} requests")
+
+    return [task.result() if task.done() and not task.cancelled() else "" for task in tasks]
+
+
+async def get_responses(urls, timeout, headers, quorum=None, deadline=None, extractor=None, max_bytes=None, process=None,
+                        trace=None, hedge_urls=None):
+    '''
+    Fetch all of the given urls at once, returning the
+    response texts in the order of the urls.
+
+    The quorum and deadline are used as in gather_responses,
+    and no request is given longer than the deadline allows.
+
+    The extractor, max_bytes and trace are used by each fetch. If process is given,
+    each response is replaced with the result of awaiting process(response),
+    and a response only arrives once it has been processed.
+
+    If hedge_urls are given, they are the alternate urls of each url, as
+    in get_response. A request which is slower than usual for its host
+    is sent to the url's next alternate, and whichever answers first is used.
+    '''
+    client = get_client()
+    session = client.session
+    if deadline is not None:
+        timeout = deadline.timeout(timeout)
+
+    if hedge_urls is None or not client.HEDGE:
+        hedge_urls = [None] * len(urls)
+
+    return await gather_responses([_fetch_and_process(url, session, timeout, headers, extractor, max_bytes, process, trace,
+                                                      alternate_urls, deadline)
+                                   for url, alternate_urls in zip(urls, hedge_urls)],
+                                  quorum=quorum,
+                                  deadline=deadline)
+
+
+async def get_response(url, timeout, headers, extractor=None, max_bytes=None, process=None, trace=None,
+                       deadline=None, hedge_urls=None):
+    '''
+    Fetch the given url, used as in get_responses.
+
+    If hedge_urls are given, and the request is slower than usual for its
+    host, the same request is sent to the next of them. Whichever answers
+    first is used.
+    '''
+    client = get_client()
+    if deadline is not None:
+        timeout = deadline.timeout(timeout)
 
+    return await _fetch_and_process(url, client.session, timeout, headers, extractor, max_bytes, process, trace,
+                                    hedge_urls if client.HEDGE else None, deadline)
 
-async def get_responses(urls, timeout, headers):
-    tasks = []
-    async with aiohttp.ClientSession(headers=headers) as session:
-        for url in urls:
-            tasks.append(fetch(url, session, timeout))
 
-        responses = await asyncio.gather(*tasks)
-        return responses
+async def warm_connections(urls, timeout, headers=None):
+    '''
+    Open a pooled connection to each of the urls, so that later
+    requests to their hosts don't wait for DNS, TCP or TLS.
+    A url which is given more than once gets that many connections.
+    '''
+    session = get_client().session
 
+    async def connect(url):
+        try:
+            async with session.head(url, timeout=timeout, headers=headers, allow_redirects=False) as response:
+                return response.status
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.debug(f"Could not warm a connection to {url}: {e}")
+            return None
 
-async def get_response(url, timeout, headers):
-    async with aiohttp.ClientSession(headers=headers) as session:
-        return await fetch(url, session, timeout)
+    return await asyncio.gather(*(connect(url) for url in urls))
 
 
 async def get_json_response(url, timeout, headers):
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url, timeout=timeout) as response:
-            return await response.json()
+    async with get_client().session.get(url, timeout=timeout, headers=headers) as response:
+        return await response.json()
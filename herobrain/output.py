@@ -10,9 +10,28 @@ import asyncio
 import operator
 import time
 import datetime
+from collections import deque
+
+from herobrain import metrics
+from herobrain import networking
 
 QUIET = False
 
+
+def _reports_counter():
+    return metrics.registry.counter("herobrain_reports_total", "Number of reports to hqhero, by outcome")
+
+
+class _Report:
+    __slots__ = ("endpoint", "info", "key", "queued_time")
+
+    def __init__(self, endpoint, info, key, queued_time):
+        self.endpoint = endpoint
+        self.info = info
+        self.key = key
+        self.queued_time = queued_time
+
+
 class HQHeroInterface:
     WAITING = "/hero/waiting"
     STARTING = "/hero/starting"
@@ -21,12 +40,21 @@ class HQHeroInterface:
     PREDICTION = "/hero/prediction"
     ANSWERS = "/hero/answers"
     FINISHED = "/hero/ended"
+
+    # Reports waiting to be sent, beyond which the oldest are dropped
+    MAX_QUEUED = 64
+    SEND_TIMEOUT = 20
+    # Times a report which could not be sent is tried again before it is given up on
+    SEND_RETRIES = 1
+    RETRY_DELAY = 0.5
     
-    def __init__(self, interface_addr):
+    def __init__(self, interface_addr, language=None):
         self._log = logging.getLogger(HQHeroInterface.__name__)
         self._log.info("Initialising for %s" % interface_addr)
 
         self._addr = interface_addr
+        # Shows of more than one language can be reported to the same hqhero
+        self._language = language
         self._score = 0
         self._num_rounds = 0
         self._predicted_answer = None
@@ -39,31 +67,125 @@ class HQHeroInterface:
         self._analysis_correct_counts = [[],[],[]]
         self._correct_counts = []
 
+        # Reports are sent one at a time, in order, over the shared client
+        self._queue = deque()
+        self._queued_keys = {}
+        self._has_reports = asyncio.Event()
+        self._sender = None
+        self._sending = False
+
     async def __do_send(self, endpoint, info):
         url = self._addr + endpoint
         payload = { "info": info }
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(url, timeout=20, json=payload) as response:
-                    data = await response.json()
-                    if "success" not in data:
-                        self._log.error(f"Error response from hqhero for {url}: {data}")
-            except (aiohttp.ClientError, aiohttp.client_exceptions.ClientConnectorError, ConnectionRefusedError) as e:
-                self._log.error(f"Could not send info to {url}: {e}")
+        if self._language is not None:
+            payload["locale"] = self._language
+        try:
+            async with networking.get_client().session.post(url, timeout=HQHeroInterface.SEND_TIMEOUT,
+                                                            json=payload) as response:
+                data = await response.json()
+                if "success" not in data:
+                    self._log.error(f"Error response from hqhero for {url}: {data}")
+                    return False
+                return True
+        except (aiohttp.ClientError, aiohttp.client_exceptions.ClientConnectorError, ConnectionRefusedError,
+                asyncio.TimeoutError) as e:
+            self._log.error(f"Could not send info to {url}: {e}")
+            return False
+
+    async def _send_reports(self):
+        delivery_times = metrics.registry.histogram("herobrain_report_delivery_seconds",
+                                                    "Time from queueing a report to hqhero to it being delivered")
+        reports = _reports_counter()
+
+        while True:
+            await self._has_reports.wait()
+            self._has_reports.clear()
+
+            while self._queue:
+                report = self._queue.popleft()
+                if report.key is not None:
+                    del self._queued_keys[report.key]
+
+                self._sending = True
+                try:
+                    sent = await self._send_report(report)
+                finally:
+                    self._sending = False
+
+                if sent:
+                    delivery_times.observe(self._event_loop.time() - report.queued_time, endpoint=report.endpoint)
+                    reports.inc(endpoint=report.endpoint, outcome="sent")
+                else:
+                    reports.inc(endpoint=report.endpoint, outcome="failed")
     
-    def _send_info(self, endpoint, info={}):
+    async def _send_report(self, report):
+        '''
+        Send a report, trying again if it could not be sent,
+        unless a newer report with its key is waiting to replace it
+
+        :return: True if the report was delivered
+        '''
+        for attempt in range(HQHeroInterface.SEND_RETRIES + 1):
+            if attempt:
+                if report.key is not None and report.key in self._queued_keys:
+                    return False
+                await asyncio.sleep(HQHeroInterface.RETRY_DELAY)
+                self._log.debug(f"Retrying {report.endpoint}")
+
+            if await self.__do_send(report.endpoint, report.info):
+                return True
+        return False
+
+    def _send_info(self, endpoint, info={}, key=None):
         '''
         Send info is a wrapper around __do_send
-        to push the send job onto the asyncio loop.
+        to queue the send job on the asyncio loop.
 
         This means that sending to hqhero does not block
-        the brain from continueing to predict the next round
+        the brain from continueing to predict the next round.
+        Reports are delivered in the order they are sent.
+
+        If a key is given, a report with the same key which
+        is still waiting to be sent is replaced by this one.
+        '''
+        if key is not None and key in self._queued_keys:
+            self._queued_keys[key].info = info
+            return
+
+        if len(self._queue) >= HQHeroInterface.MAX_QUEUED:
+            dropped = self._queue.popleft()
+            self._queued_keys.pop(dropped.key, None)
+            self._log.warning(f"Too many reports waiting for hqhero, dropped {dropped.endpoint}")
+            _reports_counter().inc(endpoint=dropped.endpoint, outcome="dropped")
+
+        report = _Report(endpoint, info, key, self._event_loop.time())
+        self._queue.append(report)
+        if key is not None:
+            self._queued_keys[key] = report
+        self._has_reports.set()
+
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.ensure_future(self._send_reports())
+
+    async def close(self, timeout=5):
         '''
+        Give the reports which are still waiting or being
+        sent a chance to be delivered, then stop sending
+        '''
+        if self._sender is None:
+            return
+
+        end_time = self._event_loop.time() + timeout
+        while (self._queue or self._sending) and self._event_loop.time() < end_time:
+            await asyncio.sleep(0.05)
 
-        asyncio.ensure_future(self.__do_send(endpoint, info))
+        self._sender.cancel()
+        self._sender = None
 
     def _print(self, s=None):
         if not QUIET:
+            if self._language is not None and s:
+                s = f"[{self._language}] {s}"
             print(s)
 
     def _print_gap(self):
@@ -78,12 +200,14 @@ class HQHeroInterface:
             self._print("Next prize: %s" % next_prize)
             self._send_info(HQHeroInterface.WAITING, 
                             {"prize": next_prize, 
-                            "nextGame": next_game_time.isoformat()})
+                            "nextGame": next_game_time.isoformat()},
+                            key=HQHeroInterface.WAITING)
         else:
             self._print("Next game not scheduled")
             self._send_info(HQHeroInterface.WAITING, 
                             {"prize": None, 
-                            "nextGame": None})
+                            "nextGame": None},
+                            key=HQHeroInterface.WAITING)
                             
     def report_starting(self):
         self._print_gap()
@@ -118,7 +242,20 @@ class HQHeroInterface:
         
         self._send_info(HQHeroInterface.ANALYSIS, {"analysis": analysis, "roundNum": question_num})
 
-    def report_prediction(self, question_num, answer_predictions, speed, analysis):
+    def report_provisional_prediction(self, question_num, answer_predictions, confidence, speed):
+        best = max(answer_predictions.items(), key=operator.itemgetter(1))[0]
+        self._print(f"Provisional: {best} ({round(confidence * 100)}% confident, {speed}s)")
+
+        self._send_info(HQHeroInterface.PREDICTION, 
+                        {"prediction": {"answers": answer_predictions,
+                                        "best": best,
+                                        "speed": speed,
+                                        "confidence": confidence,
+                                        "final": False},
+                         "roundNum": question_num},
+                        key=(HQHeroInterface.PREDICTION, question_num))
+
+    def report_prediction(self, question_num, answer_predictions, speed, analysis, trace=None, confidence=None):
         self._print()
         self._print("Prediction: ")
 
@@ -130,11 +267,24 @@ class HQHeroInterface:
         self._print()
         self._print(f"Speed: {speed}s")
 
+        prediction = {"answers": answer_predictions,
+                      "best": self._predicted_answer,
+                      "speed": speed,
+                      "final": True}
+
+        if confidence is not None:
+            self._print(f"Confidence: {round(confidence * 100)}%")
+            prediction["confidence"] = confidence
+
+        if trace is not None:
+            timings = trace.to_dict()
+            self._print(", ".join(f"{stage}: {ms}ms" for stage, ms in timings["stages"].items()))
+            prediction["timings"] = timings
+
         self._send_info(HQHeroInterface.PREDICTION, 
-                        {"prediction": {"answers": answer_predictions, 
-                                       "best": self._predicted_answer, 
-                                       "speed": speed} , 
-                         "roundNum": question_num})
+                        {"prediction": prediction, 
+                         "roundNum": question_num},
+                        key=(HQHeroInterface.PREDICTION, question_num))
         '''{'type': 'interaction', 'ts': '2018-06-19T14:11:02.525Z', 'itemId': 'chat', 'userId': 12762299, 'metadata': {'userId': 12762299, 'message': 'Morons', 'avatarUrl': 'https://d2xu1hdomh3nrx.cloudfront.net/72x72/a/98/12762299-GOroQ9.jpg', 'interaction': 'chat', 'username': 'Benjy613'}, 'sent': '2018-06-19T14:11:02.529Z'}'''
     
     def report_round_end(self, answer_counts, correct_answer, eliminated, advancing):
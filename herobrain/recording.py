@@ -0,0 +1,233 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+
+Recording of everything fetched while answering a question,
+so that it can be replayed later without a network.
+'''
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+
+import aiohttp
+
+from herobrain.networking import Client
+
+log = logging.getLogger(__name__)
+
+
+class Recording:
+    '''
+    A question message and every response fetched while answering it
+    '''
+
+    def __init__(self, message, language, responses=None):
+        self.message = message
+        self.language = language
+        # url -> (charset, body bytes)
+        self.responses = responses or {}
+
+    def add(self, url, charset, body):
+        self.responses[str(url)] = (charset, body)
+
+    def save(self, path):
+        responses = {}
+        for url, (charset, body) in self.responses.items():
+            try:
+                responses[url] = bytes(body).decode(charset or "utf-8", errors="replace")
+            except LookupError:
+                responses[url] = bytes(body).decode("utf-8", errors="replace")
+
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump({"message": self.message, "language": self.language, "responses": responses}, f)
+
+    @staticmethod
+    def load(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+
+        responses = {url: ("utf-8", text.encode("utf-8")) for url, text in data["responses"].items()}
+        return Recording(data["message"], data["language"], responses)
+
+
+class _RecordingContent:
+    def __init__(self, content, body):
+        self._content = content
+        self._body = body
+
+    def __getattr__(self, name):
+        return getattr(self._content, name)
+
+    async def iter_chunked(self, size):
+        async for chunk in self._content.iter_chunked(size):
+            self._body.extend(chunk)
+            yield chunk
+
+
+class _RecordingResponse:
+    def __init__(self, response, body):
+        self._response = response
+        self._body = body
+        self.content = _RecordingContent(response.content, body)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    async def text(self):
+        text = await self._response.text()
+        self._body.extend(text.encode(self._response.charset or "utf-8", errors="replace"))
+        return text
+
+
+class _RecordingRequest:
+    def __init__(self, request, recording, url):
+        self._request = request
+        self._recording = recording
+        self._url = url
+
+        self._charset = None
+        self._body = bytearray()
+
+    async def __aenter__(self):
+        response = await self._request.__aenter__()
+        self._charset = response.charset
+        return _RecordingResponse(response, self._body)
+
+    async def __aexit__(self, *exc_info):
+        # Only a response which was read and used without failing or being cancelled is
+        # recorded, so a request which is given up on never replaces a complete body
+        if exc_info[0] is None:
+            self._recording.add(self._url, self._charset, self._body)
+        return await self._request.__aexit__(*exc_info)
+
+
+class _RecordingSession:
+    def __init__(self, session, client):
+        self._session = session
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def get(self, url, **kwargs):
+        request = self._session.get(url, **kwargs)
+        if self._client.recording is None:
+            return request
+        return _RecordingRequest(request, self._client.recording, url)
+
+
+class RecordingClient(Client):
+    '''
+    A client which records the responses it gets while a
+    question is being answered, saving each question to
+    its own archive in the given directory
+    '''
+    # Every request is recorded at its own url, to be replayed the same way
+    HEDGE = False
+
+    def __init__(self, path, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._path = path
+        self.recording = None
+
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def session(self):
+        return _RecordingSession(super().session, self)
+
+    def start(self, message, language):
+        self.recording = Recording(message, language)
+
+    async def stop(self):
+        '''
+        Stop recording, and save what has been recorded
+        '''
+        recording = self.recording
+        self.recording = None
+        if recording is None:
+            return
+
+        file_path = os.path.join(self._path, f"{int(time.time())}-{recording.message.get('questionNumber', 0)}.json.gz")
+        await asyncio.get_event_loop().run_in_executor(None, recording.save, file_path)
+        self._log.info(f"Recorded {len(recording.responses)} responses to {file_path}")
+
+
+class _ReplayContent:
+    def __init__(self, body):
+        self._body = body
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self._body), size):
+            yield self._body[i:i + size]
+
+
+class _ReplayResponse:
+    def __init__(self, url, charset, body):
+        self.url = url
+        self.status = 200
+        self.charset = charset
+        self.content = _ReplayContent(body)
+        self._body = body
+
+    async def read(self):
+        return bytes(self._body)
+
+    async def text(self):
+        return self._body.decode(self.charset or "utf-8", errors="replace")
+
+    async def json(self):
+        return json.loads(await self.text())
+
+
+class _ReplayRequest:
+    def __init__(self, url, response):
+        self._url = url
+        self._response = response
+
+    async def __aenter__(self):
+        if self._response is None:
+            raise aiohttp.ClientConnectionError(f"{self._url} was not recorded")
+
+        # Let other tasks run, as a real request would
+        await asyncio.sleep(0)
+        return _ReplayResponse(self._url, *self._response)
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class _ReplaySession:
+    closed = False
+
+    def __init__(self, recording):
+        self._recording = recording
+
+    def get(self, url, **kwargs):
+        return _ReplayRequest(url, self._recording.responses.get(str(url)))
+
+    async def close(self):
+        pass
+
+
+class ReplayClient(Client):
+    '''
+    A client which answers requests from a recording, without a network.
+    Requests which were not recorded fail.
+    '''
+
+    def __init__(self, recording):
+        super().__init__()
+        self._session = _ReplaySession(recording)
+
+    @property
+    def session(self):
+        return self._session
+
+    async def close(self):
+        pass
@@ -4,15 +4,21 @@ MIT License
 Copyright (c) 2018, Kevin Wu <github.com/Exaphis>
 '''
 
+import asyncio
+import json
 import logging
 import re
+import time
+from functools import partial
 from html import unescape
 
 from bs4 import BeautifulSoup
 from unidecode import unidecode
 
+from herobrain import execution
 from herobrain import networking
-from herobrain import localisation
+from herobrain.cache import PageCache
+from herobrain.counting import Page, Tokeniser, count_terms, tokenise
 
 log = logging.getLogger(__name__)
 
@@ -21,8 +27,29 @@ HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:58.0) Gec
            "Accept-Language": "en-US,en;q=0.5",
            "Accept-Encoding": "gzip, deflate"}
 
+# Pages are cut off after this many bytes, so huge pages can't hold up a question
+MAX_PAGE_BYTES = 512 * 1024
 
-def get_google_links(page, num_results):
+PUNCTUATION = "!\"#$%&\'()*+,-.:;<=>?@[\\]^_`{|}~�“”"
+PUNCTUATION_TO_NONE = str.maketrans({key: None for key in PUNCTUATION})
+
+# Token ids of the words of pages, shared by every question
+page_cache = PageCache()
+
+# Optional DiskStore of search results and page texts, kept between restarts
+_store = None
+
+# A result on a google results page is a <div class="r"> starting with its link
+GOOGLE_RESULT = re.compile(r"""<div\b[^>]*\bclass=["'](?:[^"']*\s)?r(?:\s[^"']*)?["'][^>]*>""", re.IGNORECASE)
+GOOGLE_RESULT_LINK = re.compile(r"""<a\b[^>]*?\bhref=["']([^"']*)["']""", re.IGNORECASE)
+DIV_TAG = re.compile(r"<(/?)div\b", re.IGNORECASE)
+
+RAW_TEXT_TAG = re.compile(r"<(script|style)\b", re.IGNORECASE)
+RAW_TEXT_ENDS = {"script": re.compile(r"</script", re.IGNORECASE),
+                 "style": re.compile(r"</style", re.IGNORECASE)}
+
+
+def _parse_google_links(page, num_results):
     soup = BeautifulSoup(page, "html.parser")
     results = soup.findAll("div", {"class": "r"})
 
@@ -32,48 +59,340 @@ def get_google_links(page, num_results):
         if url is not None:
             links.append(url["href"])
     links = list(dict.fromkeys(links))  # Remove duplicates while preserving order
-    log.debug(links)
     return links[:num_results]
 
 
-async def search_google(question, num_results):
+def _find_div_end(page, position):
+    """
+    Returns the position of the closing tag of the div which the position is inside,
+    or the end of the page if it is never closed.
+    """
+    depth = 1
+    for tag in DIV_TAG.finditer(page, position):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return tag.start()
+    return len(page)
+
+
+def _scan_google_links(page, num_results):
+    """
+    Returns the first link in each result of a google results page, without parsing the page.
+    Stops scanning once num_results unique links are found.
+    """
+    links = {}  # Ordered, and removes duplicates
+
+    result = GOOGLE_RESULT.search(page)
+    while result is not None and len(links) < num_results:
+        # Only look inside this result
+        link = GOOGLE_RESULT_LINK.search(page, result.end(), _find_div_end(page, result.end()))
+        if link is not None:
+            links[unescape(link.group(1))] = None
+
+        result = GOOGLE_RESULT.search(page, result.end())
+
+    return list(links)
+
+
+def get_google_links(page, num_results):
+    links = _scan_google_links(page, num_results)
+
+    if not links and page:
+        log.debug("Results layout not recognised, parsing the whole page")
+        links = _parse_google_links(page, num_results)
+
+    log.debug(links)
+    return links
+
+
+def set_store(store):
+    """
+    Keep search results and page texts in the given DiskStore, or stop storing them if None.
+    """
+    global _store
+    _store = store
+
+
+def _read(key, parse):
+    value = _store.get(key)
+    return parse(value) if value is not None else None
+
+
+async def _load(key, parse):
+    '''
+    :param parse: Function applied to the stored value, off the event loop
+    :return: The parsed value of the key, None if it is not stored
+    '''
+    if _store is None:
+        return None
+
+    # Reading decompresses the value from disk, so keep it off the event loop
+    return await asyncio.get_event_loop().run_in_executor(None, _read, key, parse)
+
+
+def _save(key, value):
+    # Failures are empty, and not worth storing
+    if _store is not None and value:
+        # Writing compresses the value, so keep it off the event loop
+        asyncio.get_event_loop().run_in_executor(None, _store.put, key, value)
+
+
+async def _load_page(url):
+    return await _load(f"page:{url}", tokenise)
+
+
+def _save_page(url, page):
+    # Token ids are only meaningful within their page, so pages are stored as text
+    if _store is not None and page:
+        asyncio.get_event_loop().run_in_executor(None, lambda: _store.put(f"page:{url}", page.text()))
+
+
+async def _load_links(query, num_results):
+    return await _load(f"serp:{num_results}:{query}", json.loads)
+
+
+def _save_links(query, num_results, links):
+    if links:
+        _save(f"serp:{num_results}:{query}", json.dumps(links))
+
+
+async def search_google(question, num_results, locale, trace=None, deadline=None):
     """
     Returns num_results urls from a google search of question.
     :param question: Question to search
     :param num_results: Number of results to return
+    :param locale: Locale of the question, which decides the google domain to use
+    :param trace: Trace to add the request to
+    :param deadline: If given, Deadline the search must be finished by
     :return: List of length num_results of urls retrieved from the search
     """
     # Could use Google's Custom Search API here, limit of 100 queries per day
     # result = service.cse().list(q=question, cx=CSE_ID, num=num_results).execute()
     # return result["items"]
-    page = await networking.get_response(localisation.GOOGLE_URL.format(question), timeout=3, headers=HEADERS)
-    return get_google_links(page, num_results)
+    query = locale.google_url.format(question)
 
+    links = await _load_links(query, num_results)
+    if links is None:
+        # Another google domain is asked if this one is slow
+        page = await networking.get_response(query, timeout=3, headers=HEADERS, trace=trace, deadline=deadline,
+                                             hedge_urls=[url.format(question) for url in locale.alternate_google_urls])
+        links = get_google_links(page, num_results)
+        _save_links(query, num_results, links)
 
-async def multiple_search(questions, num_results):
-    queries = list(map(localisation.GOOGLE_URL.format, questions))
-    pages = await networking.get_responses(queries, timeout=3, headers=HEADERS)
-    link_list = [get_google_links(page, num_results) for page in pages]
-    return link_list
+    return links
+
+
+class TextExtractor:
+    """
+    Incrementally extracts the words of a html page.
+
+    The page can be fed in chunks as it is downloaded. Scripts, styles,
+    comments and tags are stripped as they arrive, and the text between
+    them is unescaped, transliterated to ascii, lowercased, has its
+    punctuation removed and is converted to token ids.
+    """
+    TEXT, TAG, COMMENT, RAW_TEXT = range(4)
+
+    # If a single word gets this long, stop waiting for it to finish
+    MAX_WORD_LENGTH = 1024
+
+    def __init__(self, trace=None, url=None):
+        self._trace = trace
+        self._url = url
+        self._seconds = 0
+
+        self._state = TextExtractor.TEXT
+        self._raw_text_end = None
+        self._buffer = ""
+        self._tokeniser = Tokeniser()
+
+    def _add_text(self, text):
+        self._tokeniser.add(unidecode(unescape(text)).lower().translate(PUNCTUATION_TO_NONE))
+
+    def _find_text_end(self, buffer, position):
+        # Only take text up to the last whitespace, as the
+        # last word or entity may continue in the next chunk
+        end = max(buffer.rfind(space, position) for space in " \n\t\r")
+        if end == -1 and len(buffer) - position < TextExtractor.MAX_WORD_LENGTH:
+            return position
+        return end if end != -1 else len(buffer)
+
+    def feed(self, data):
+        start_time = time.perf_counter()
+        self._feed(data)
+        self._seconds += time.perf_counter() - start_time
+
+    def _feed(self, data):
+        buffer = self._buffer + data
+        position = 0
+
+        while position < len(buffer):
+            if self._state == TextExtractor.TEXT:
+                start = buffer.find("<", position)
+                if start == -1:
+                    end = self._find_text_end(buffer, position)
+                    self._add_text(buffer[position:end])
+                    position = end
+                    break
+
+                self._add_text(buffer[position:start])
+                position = start
+
+                # Not enough of the tag has arrived to know what it is
+                if ">" not in buffer[position:position + 8] and len(buffer) - position < 8:
+                    break
+
+                if buffer.startswith("<!--", position):
+                    self._state = TextExtractor.COMMENT
+                    position += 4
+                else:
+                    raw_text_tag = RAW_TEXT_TAG.match(buffer, position)
+                    self._raw_text_end = RAW_TEXT_ENDS[raw_text_tag.group(1).lower()] if raw_text_tag else None
+                    self._state = TextExtractor.TAG
+                    position += 1
+
+            elif self._state == TextExtractor.TAG:
+                end = buffer.find(">", position)
+                if end == -1:
+                    position = len(buffer)
+                    break
+
+                position = end + 1
+                self._state = TextExtractor.RAW_TEXT if self._raw_text_end else TextExtractor.TEXT
+
+            elif self._state == TextExtractor.COMMENT:
+                end = buffer.find("-->", position)
+                if end == -1:
+                    # Keep enough to match an end split over chunks
+                    position = max(position, len(buffer) - 2)
+                    break
+
+                position = end + 3
+                self._state = TextExtractor.TEXT
+
+            else:
+                end = self._raw_text_end.search(buffer, position)
+                if end is None:
+                    position = max(position, len(buffer) - 8)
+                    break
+
+                # The end tag itself is stripped as a normal tag
+                position = end.start()
+                self._raw_text_end = None
+                self._state = TextExtractor.TEXT
+
+        self._buffer = buffer[position:]
+
+    def close(self):
+        """
+        Finish extracting the page.
+        :return: Page of the words of the page
+        """
+        start_time = time.perf_counter()
+
+        if self._state == TextExtractor.TEXT:
+            self._add_text(self._buffer)
+        self._buffer = ""
+
+        end_time = time.perf_counter()
+        self._seconds += end_time - start_time
+        if self._trace is not None:
+            # Cleaning was spread over the download, so the span only covers its total time
+            self._trace.add("cleaning", end_time - self._seconds, end_time, url=self._url)
+
+        return self._tokeniser.close()
 
 
 def clean_html(html):
-    # First we remove inline JavaScript/CSS:
-    cleaned = re.sub(r"(?is)<(script|style).*?>.*?(</\1>)", "", html.strip())
-    # Then we remove html comments. This has to be done before removing regular
-    # tags since comments can contain '>' characters.
-    cleaned = re.sub(r"(?s)<!--(.*?)-->[\n]?", "", cleaned)
-    # Next we can remove the remaining tags:
-    cleaned = re.sub(r"(?s)<.*?>", " ", cleaned)
-    # Finally, we deal with whitespace
-    cleaned = re.sub(r"&nbsp;", " ", cleaned)
-    cleaned = re.sub(r"\n", " ", cleaned)
-    cleaned = re.sub(r"\s\s+", " ", cleaned)
+    """
+    Returns the Page of the lowercase, punctuation free words of a whole html page.
+    """
+    extractor = TextExtractor()
+    extractor.feed(html)
+    return extractor.close()
+
+
+def clean_and_count(html, counter):
+    """
+    Returns the Page of a whole html page, and the counts of the counter's terms in it,
+    so that a page only has to be sent to a worker once.
+    """
+    page = clean_html(html)
+    return page, count_terms(counter, page)
+
+
+async def get_clean_texts(urls, timeout=2, headers=HEADERS, quorum=None, deadline=None, max_bytes=MAX_PAGE_BYTES,
+                          trace=None, on_text=None, counter=None, on_counts=None):
+    """
+    Returns the Pages of the cleaned, lowercase and punctuation free words of the pages
+    at the given urls. Pages are taken from the page cache, or the store, where possible.
+    :param urls: Urls of the pages to fetch
+    :param timeout: Timeout of each page request
+    :param headers: Headers to send with each request
+    :param quorum: If given, stop waiting once this many pages have arrived
+    :param deadline: If given, Deadline to stop waiting for pages at
+    :param max_bytes: Number of bytes of each page to read, the rest is ignored
+    :param trace: Trace to add the fetching and cleaning of each page to
+    :param on_text: If given, called with the index and Page of each page as soon as it arrives
+    :param counter: If given, TermCounter to count the terms of each page with
+    :param on_counts: If given, called with the index and term counts of each page as soon as it is counted
+    :return: List of the Page of each url in order, empty for pages which did not arrive
+    """
+    executor = execution.get_executor()
+    # Counts of the pages which were counted as they were cleaned
+    counted = {}
+
+    async def run(stage, url, function, *args):
+        if trace is None:
+            return await executor.run(function, *args)
+
+        with trace.span(stage, url=url):
+            return await executor.run(function, *args)
+
+    async def fetch_clean_text(url):
+        page = await _load_page(url)
+        if page is not None:
+            return page
+
+        if not executor.is_pooled:
+            # Clean the page on the loop as it streams in
+            page = await networking.get_response(url, timeout, headers,
+                                                 extractor=partial(TextExtractor, trace, url),
+                                                 max_bytes=max_bytes,
+                                                 trace=trace)
+        else:
+            async def clean_in_worker(html):
+                if counter is None:
+                    return await run("cleaning", url, clean_html, html)
+
+                page, counted[url] = await run("cleaning", url, clean_and_count, html, counter)
+                return page
+
+            page = await networking.get_response(url, timeout, headers,
+                                                 max_bytes=max_bytes,
+                                                 process=clean_in_worker,
+                                                 trace=trace)
 
-    return unidecode(unescape(cleaned.strip()))
+        # Failed requests are empty text
+        page = page or Page()
+        _save_page(url, page)
+        return page
 
+    async def get_page(index, url):
+        page = await page_cache.get_or_fetch(url, fetch_clean_text)
+        if page and counter is not None:
+            # Pages from the cache, or fetched by someone else, are counted on their own
+            counts = counted.pop(url, None)
+            if counts is None:
+                counts = await run("counting", url, count_terms, counter, page)
 
-async def get_clean_texts(urls, timeout=2, headers=HEADERS):
-    responses = await networking.get_responses(urls, timeout, headers)
+            if on_counts is not None:
+                on_counts(index, counts)
+        return page
 
-    return [clean_html(r).lower() for r in responses]
+    pages = await networking.gather_responses([get_page(index, url) for index, url in enumerate(urls)],
+                                              quorum=quorum,
+                                              deadline=deadline,
+                                              on_response=on_text)
+    # Pages which did not arrive in time are empty text
+    return [page or Page() for page in pages]
@@ -0,0 +1,157 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+'''
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+# Each file starts with the time it was written
+HEADER = struct.Struct("<d")
+
+
+class DiskStore:
+    '''
+    A persistent store of compressed text values, keyed by string.
+
+    Each value is zlib compressed into a file named by the hash
+    of its key, and read back through mmap. Values expire after
+    ttl seconds, and the least recently used values are evicted
+    once the files take up more than max_size bytes.
+
+    The store can be written to from another thread.
+    '''
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, compression_level=6):
+        self._log = logging.getLogger(DiskStore.__name__)
+
+        self._path = path
+        self._max_size = max_size
+        self._ttl = ttl
+        self._compression_level = compression_level
+
+        self._lock = threading.Lock()
+        # file path -> file size, least recently used first
+        self._files = OrderedDict()
+        self._size = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._load_index()
+
+    def __len__(self):
+        return len(self._files)
+
+    @property
+    def size(self):
+        return self._size
+
+    def _load_index(self):
+        files = []
+        for directory, _, names in os.walk(self._path):
+            for name in names:
+                file_path = os.path.join(directory, name)
+                if name.endswith(".tmp"):
+                    # Left over from an interrupted write
+                    os.remove(file_path)
+                    continue
+
+                stat = os.stat(file_path)
+                files.append((stat.st_mtime, file_path, stat.st_size))
+
+        for _, file_path, size in sorted(files):
+            self._files[file_path] = size
+            self._size += size
+
+        self._log.info(f"Loaded {len(self._files)} values ({round(self._size / 1024 / 1024, 1)}MB) from {self._path}")
+
+    def _file_path(self, key):
+        key_hash = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self._path, key_hash[:2], key_hash)
+
+    def _remove(self, file_path):
+        with self._lock:
+            size = self._files.pop(file_path, None)
+            if size is None:
+                return
+            self._size -= size
+
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        '''
+        :return: The stored value of the key, None if it is not stored or has expired
+        '''
+        file_path = self._file_path(key)
+        with self._lock:
+            if file_path not in self._files:
+                return None
+            self._files.move_to_end(file_path)
+
+        try:
+            with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                written_time, = HEADER.unpack_from(data)
+                if written_time + self._ttl <= time.time():
+                    value = None
+                else:
+                    with memoryview(data) as view:
+                        value = zlib.decompress(view[HEADER.size:]).decode("utf-8")
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            self._log.error(f"Could not read {file_path}: {e}")
+            value = None
+
+        if value is None:
+            self._remove(file_path)
+            return None
+
+        # Keep track of use between restarts
+        os.utime(file_path)
+        return value
+
+    def put(self, key, value):
+        file_path = self._file_path(key)
+        data = HEADER.pack(time.time()) + zlib.compress(value.encode("utf-8"), self._compression_level)
+
+        if len(data) > self._max_size:
+            return
+
+        temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, file_path)
+        except OSError as e:
+            self._log.error(f"Could not write {file_path}: {e}")
+            return
+
+        evicted = []
+        with self._lock:
+            self._size += len(data) - self._files.pop(file_path, 0)
+            self._files[file_path] = len(data)
+
+            while self._size > self._max_size:
+                evicted_path, size = self._files.popitem(last=False)
+                self._size -= size
+                evicted.append(evicted_path)
+
+        for evicted_path in evicted:
+            try:
+                os.remove(evicted_path)
+            except OSError:
+                pass
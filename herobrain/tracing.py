@@ -0,0 +1,62 @@
+'''
+MIT License
+
+Copyright (c) 2018, Oliver Bell <freshollie@gmail.com>
+'''
+
+import time
+from contextlib import contextmanager
+
+
+class Trace:
+    '''
+    Timings of the stages of answering a question.
+
+    A stage can be made of many spans, which may overlap,
+    for instance when pages are fetched concurrently.
+    '''
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.spans = []
+
+    def add(self, stage, start, end, **info):
+        '''
+        Add a span of the stage, with times from time.perf_counter
+        '''
+        self.spans.append(dict(stage=stage, start=start - self._start, duration=end - start, **info))
+
+    @contextmanager
+    def span(self, stage, **info):
+        '''
+        Time the enclosed block as a span of the stage.
+        Yields the span's info, which can be added to while in the block.
+        '''
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.add(stage, start, time.perf_counter(), **info)
+
+    def stage_times(self):
+        '''
+        :return: Dictionary of stage to the seconds from the start
+                 of its first span to the end of its last span
+        '''
+        bounds = {}
+        for span in self.spans:
+            start, end = span["start"], span["start"] + span["duration"]
+            if span["stage"] in bounds:
+                first_start, last_end = bounds[span["stage"]]
+                start, end = min(start, first_start), max(end, last_end)
+            bounds[span["stage"]] = (start, end)
+
+        return {stage: end - start for stage, (start, end) in bounds.items()}
+
+    def to_dict(self):
+        '''
+        :return: The stage times and spans, in milliseconds, ready to be sent
+        '''
+        return {"stages": {stage: round(seconds * 1000, 1) for stage, seconds in self.stage_times().items()},
+                "spans": [dict(span, start=round(span["start"] * 1000, 1), duration=round(span["duration"] * 1000, 1))
+                          for span in self.spans]}
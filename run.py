@@ -9,36 +9,113 @@ import logging
 import argparse
 from herobrain import Herobrain
 from herobrain import localisation
+from herobrain import execution
 import sys
 
+LOCALES = [localisation.ENGLISH_UK, localisation.ENGLISH_US, localisation.GERMANY]
+
+
+def split_locales(values, name):
+    '''
+    Split the values given as LOCALE=VALUE from the one value for every other locale
+    :return: The value for every other locale, and a dict of the value of each locale
+    '''
+    others = []
+    by_locale = {}
+    for value in values:
+        locale, _, locale_value = value.partition("=")
+        if locale in LOCALES and locale_value:
+            by_locale[locale] = locale_value
+        else:
+            others.append(value)
+
+    if len(others) > 1:
+        sys.exit(f"Only one {name} can be given without a locale")
+    # Every other locale keeps the default
+    default = others[0] if others else parser.get_default(name.replace("-", "_"))[0]
+    return default, by_locale
+
 
 # Get the token as input
 parser = argparse.ArgumentParser(description="Herobrain, a quiz prediction processor")
-parser.add_argument("-t", "--token", dest="token", default="", help="HQTrivia bearer token")
-parser.add_argument("-s", "--output", dest="output", default="http://localhost:1029", help="HQhero server")
+parser.add_argument("-t", "--token", 
+                    dest="token", 
+                    nargs="+",
+                    default=[""], 
+                    help="HQTrivia bearer token, or LOCALE=TOKEN for the show of one locale")
+parser.add_argument("-s", "--output", 
+                    dest="output", 
+                    nargs="+",
+                    default=["http://localhost:1029"], 
+                    help="HQhero server, or LOCALE=OUTPUT for the show of one locale")
 parser.add_argument("-l", "--locale", 
-                    dest="locale", 
-                    default=localisation.ENGLISH_UK, 
-                    choices=[localisation.ENGLISH_UK, 
-                             localisation.ENGLISH_US, 
-                             localisation.GERMANY],
-                    help="Configures methods of question analysis")
+                    dest="locales", 
+                    nargs="+",
+                    default=[localisation.ENGLISH_UK], 
+                    choices=LOCALES,
+                    help="Locales of the shows to follow, each configures methods of question analysis")
 parser.add_argument("--test", action="store_true", dest="test", help="Run in test mode, doesn't require bearer token")
-parser.add_argument("--quiz-api", dest="quiz_api", default="https://api-quiz.hype.space", help="HQTrivia quiz-api")   
+parser.add_argument("--quiz-api", 
+                    dest="quiz_api", 
+                    nargs="+",
+                    default=["https://api-quiz.hype.space"], 
+                    help="HQTrivia quiz-api, or LOCALE=QUIZ_API for the show of one locale")   
 parser.add_argument("--test-api", dest="test_api", default="http://localhost:8732", help="Simulated quiz-api, requires --test")
+parser.add_argument("--workers", 
+                    dest="workers", 
+                    type=int, 
+                    default=execution.DEFAULT_WORKERS, 
+                    help="Number of analysis worker processes, 0 analyses on the event loop")
+parser.add_argument("--store", 
+                    dest="store", 
+                    default=None, 
+                    help="Directory to keep search results and pages in between restarts")
+parser.add_argument("--store-size", 
+                    dest="store_size", 
+                    type=int, 
+                    default=512, 
+                    help="Maximum size of the store in MB")
+parser.add_argument("--memory", 
+                    dest="memory", 
+                    default=None, 
+                    help="Directory to remember the answer of each question in, to answer repeated questions instantly")
+parser.add_argument("--record", 
+                    dest="record", 
+                    default=None, 
+                    help="Directory to record the responses of each question to, for benchmark.py")
+parser.add_argument("--metrics-port", 
+                    dest="metrics_port", 
+                    type=int, 
+                    default=None, 
+                    help="Port to serve the latency of each stage on, at /metrics")
 parser.add_argument("--log-level", dest="log_level", default="info", choices=["critical", "error", "warning", "info", "debug"])
 
 args = parser.parse_args()
 
-if not args.test and not args.token:
-    sys.exit("Token is required when not in test mode")
+token, tokens = split_locales(args.token, "token")
+output, outputs = split_locales(args.output, "output")
+quiz_api, quiz_apis = split_locales(args.quiz_api, "quiz-api")
+if args.test:
+    quiz_api, quiz_apis = args.test_api, {}
+
+if not args.test and not all(token or tokens.get(locale) for locale in args.locales):
+    sys.exit("A token for every locale is required when not in test mode")
 
-# Set the localisation
-localisation.set_as(args.locale)
+if args.record and len(args.locales) > 1:
+    sys.exit("Only one locale can be recorded at a time")
 
 # Set up logging
 logging.basicConfig(level=args.log_level.upper())
 logging.getLogger('websockets').setLevel(logging.ERROR)
 
-service = Herobrain(args.token, args.output, args.test_api if args.test else args.quiz_api)
+service = Herobrain(token, output, quiz_api, 
+                    locales=args.locales,
+                    accounts={locale: (tokens.get(locale), quiz_apis.get(locale), outputs.get(locale))
+                              for locale in args.locales},
+                    workers=args.workers, 
+                    store_path=args.store, 
+                    store_size=args.store_size * 1024 * 1024, 
+                    memory_path=args.memory,
+                    record_path=args.record,
+                    metrics_port=args.metrics_port)
 service.run()
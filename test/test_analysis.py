@@ -1 +1,51 @@
 import aiounittest
+import unittest
+
+from herobrain.analysis import QuestionAnalyser, _analysis_method1, _analysis_method3, _method3_weights
+from herobrain.counting import PageTotals
+
+
+def _totals(*pages):
+    totals = PageTotals()
+    for counts in pages:
+        totals.add(counts)
+    return totals
+
+
+class TestMethods(unittest.TestCase):
+    def test_method1(self):
+        totals = _totals({"paris": 3, "rome": 1}, {"paris": 1, "rome": 0})
+
+        self.assertEqual(_analysis_method1(totals, ["paris", "rome"], False), {"paris": 0.8, "rome": 0.2})
+        # The answer which occurs the least is best
+        self.assertEqual(_analysis_method1(totals, ["paris", "rome"], True), {"paris": 0.2, "rome": 0.8})
+
+    def test_method3(self):
+        weights = _method3_weights(["capital", "france"], {"france"})
+        self.assertEqual(weights, {"capital": 0.75, "france": 1})
+
+        answer_totals = {"paris": _totals({"capital": 2, "france": 1}),
+                         "rome": _totals({"capital": 1}, {"capital": 0.5})}
+
+        self.assertEqual(_analysis_method3(answer_totals, weights, False), {"paris": 2.5 / 3.625,
+                                                                            "rome": 1.125 / 3.625})
+
+
+class TestRefine(aiounittest.AsyncTestCase):
+    async def test_forced_refine_skips_throttle(self):
+        analyser = QuestionAnalyser("Which is the capital of France?", ["Paris", "Rome"])
+        analyser._parsed_answers = ["paris", "rome"]
+        analyser._parsed_answers_to_answer = {"paris": "Paris", "rome": "Rome"}
+        analyser._answer_totals = {"paris": _totals(), "rome": _totals()}
+        analyser._answer_keywords = {"paris": ["paris"], "rome": ["rome"]}
+
+        updates = []
+        analyser._on_update = lambda probs, confidence: updates.append(probs)
+
+        # Too few pages for a provisional prediction
+        analyser._add_counts(analyser._question_totals, 0, {"paris": 3, "rome": 1})
+        self.assertEqual(updates, [])
+
+        analyser._refine(force=True)
+        self.assertEqual(len(updates), 1)
+        self.assertGreater(updates[0]["Paris"], updates[0]["Rome"])
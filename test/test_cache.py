@@ -0,0 +1,74 @@
+import asyncio
+import sys
+
+import aiounittest
+
+from herobrain.cache import PageCache
+
+
+class TestPageCache(aiounittest.AsyncTestCase):
+    def test_evicts_least_recently_used(self):
+        text_size = sys.getsizeof("a" * 100)
+        cache = PageCache(max_size=text_size * 2)
+
+        cache.put("1", "a" * 100)
+        cache.put("2", "b" * 100)
+        cache.get("1")
+        cache.put("3", "c" * 100)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("2"))
+        self.assertEqual(cache.get("1"), "a" * 100)
+        self.assertLessEqual(cache.size, text_size * 2)
+
+    async def test_expires(self):
+        cache = PageCache(ttl=0.01)
+        cache.put("1", "text")
+        await asyncio.sleep(0.02)
+
+        self.assertIsNone(cache.get("1"))
+        self.assertEqual(cache.size, 0)
+
+    async def test_coalesces_fetches(self):
+        cache = PageCache()
+        fetched = []
+
+        async def fetch(url):
+            fetched.append(url)
+            await asyncio.sleep(0.01)
+            return "text"
+
+        texts = await asyncio.gather(*(cache.get_or_fetch("1", fetch) for _ in range(3)))
+
+        self.assertEqual(texts, ["text"] * 3)
+        self.assertEqual(fetched, ["1"])
+        self.assertEqual(cache.get("1"), "text")
+
+    async def test_does_not_cache_failures(self):
+        cache = PageCache()
+
+        async def fetch(url):
+            return ""
+
+        self.assertEqual(await cache.get_or_fetch("1", fetch), "")
+        self.assertIsNone(cache.get("1"))
+
+    async def test_cancels_fetch_without_waiters(self):
+        cache = PageCache()
+        started = asyncio.Event()
+
+        async def fetch(url):
+            started.set()
+            await asyncio.sleep(10)
+
+        first = asyncio.ensure_future(cache.get_or_fetch("1", fetch))
+        second = asyncio.ensure_future(cache.get_or_fetch("1", fetch))
+        await started.wait()
+
+        first.cancel()
+        await asyncio.sleep(0)
+        self.assertIn("1", cache._in_flight)
+
+        second.cancel()
+        await asyncio.sleep(0.01)
+        self.assertNotIn("1", cache._in_flight)
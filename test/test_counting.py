@@ -0,0 +1,87 @@
+import pickle
+import sys
+import unittest
+
+from herobrain.counting import Page, PageIndex, PageTotals, TermCounter, tokenise
+
+
+class TestTokenise(unittest.TestCase):
+    def test_interns_each_word_once(self):
+        page = tokenise("the cat and  the dog")
+
+        self.assertEqual(len(page), 5)
+        self.assertEqual(page.vocabulary, ["the", "cat", "and", "dog"])
+        self.assertEqual(list(map(ord, page.tokens)), [0, 1, 2, 0, 3])
+        self.assertEqual(page.text(), "the cat and the dog")
+
+    def test_unpickled_words_are_interned(self):
+        page = pickle.loads(pickle.dumps(tokenise("the cat")))
+
+        self.assertEqual(page.text(), "the cat")
+        self.assertIs(page.vocabulary[1], sys.intern("cat"))
+
+
+class TestPageIndex(unittest.TestCase):
+    def test_counts_words_and_phrases(self):
+        page = PageIndex(tokenise("the new york times is in new york new york"))
+
+        self.assertEqual(page.num_words, 10)
+        self.assertEqual(page.count(("new",)), 3)
+        self.assertEqual(page.count(("new", "york")), 3)
+        self.assertEqual(page.count(("new", "york", "times")), 1)
+        self.assertEqual(page.count(("york", "new", "york")), 1)
+        self.assertEqual(page.count(("old", "york")), 0)
+        self.assertEqual(page.count(()), 0)
+
+    def test_phrases_do_not_overlap(self):
+        page = PageIndex(tokenise("ha ha ha"))
+
+        self.assertEqual(page.count(("ha", "ha")), 1)
+
+    def test_ids_of_any_character(self):
+        vocabulary = [f"w{i}" for i in range(0xe000)]
+        # Including the ids which are surrogate code points
+        page = PageIndex(Page(vocabulary, "".join(map(chr, (0xd800, 0xdfff, 0xd800, 0xdfff)))))
+
+        self.assertEqual(page.count(("w55296", "w57343")), 2)
+        self.assertEqual(page.count(("w57343", "w55296")), 1)
+
+
+class TestTermCounter(unittest.TestCase):
+    def test_counts_words_and_phrases(self):
+        counter = TermCounter(["paris", "new york", "york"])
+        counts = counter.count(counter.index(tokenise("paris is not new york but york is in england paris")))
+
+        self.assertEqual(counts, {"paris": 2, "new york": 1, "york": 2})
+
+    def test_matches_whole_words(self):
+        counter = TermCounter(["cat"])
+
+        self.assertEqual(counter.count(counter.index(tokenise("cats concatenate cat"))), {"cat": 1})
+
+    def test_only_counts_the_same_word(self):
+        # These words have the same crc32
+        counter = TermCounter(["plumless"])
+
+        self.assertEqual(counter.count(counter.index(tokenise("buckeroo buckeroo"))), {"plumless": 0})
+
+    def test_terms_are_not_patterns(self):
+        counter = TermCounter(["c++", "$5", "a.b"], normalise=lambda term: term.strip("+$").replace(".", ""))
+
+        self.assertEqual(counter.count(counter.index(tokenise("c costs 5 not ab"))), {"c++": 1, "$5": 1, "a.b": 1})
+
+    def test_empty_term(self):
+        counter = TermCounter(["  "])
+
+        self.assertEqual(counter.count(counter.index(tokenise("some text"))), {"  ": 0})
+
+
+class TestPageTotals(unittest.TestCase):
+    def test_weighs_all_pages(self):
+        totals = PageTotals()
+        totals.add({"paris": 2, "york": 1})
+        totals.add({"paris": 1, "london": 3})
+
+        self.assertEqual(len(totals), 2)
+        self.assertEqual(totals.weigh({"paris": 1}), 3)
+        self.assertEqual(totals.weigh({"paris": 0.5, "london": 1, "rome": 10}), 4.5)
@@ -0,0 +1,19 @@
+import asyncio
+
+import aiounittest
+
+from herobrain.deadline import Deadline
+
+
+class TestDeadline(aiounittest.AsyncTestCase):
+    async def test_split(self):
+        deadline = Deadline(1)
+        stage = deadline.split(0.5, limit=0.2)
+        self.assertLessEqual(stage.remaining(), 0.2)
+
+        # An overrunning stage leaves less time for the rest
+        await asyncio.sleep(0.1)
+        self.assertLess(deadline.split(0.5).remaining(), 0.5)
+        self.assertLessEqual(deadline.before(2).end, deadline.end)
+        self.assertTrue(deadline.before(2).expired())
+        self.assertGreater(deadline.before(2).timeout(3), 0)
@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+import aiounittest
+
+from herobrain.execution import Executor
+
+
+class TestExecutor(aiounittest.AsyncTestCase):
+    async def test_runs_in_pool(self):
+        executor = Executor(workers=1, languages=())
+        executor.start()
+        try:
+            self.assertEqual(await executor.run(max, 1, 2), 2)
+            with self.assertRaises(ValueError):
+                await executor.run(int, "not a number")
+        finally:
+            executor.close()
+
+    async def test_cancelled_jobs_are_not_run(self):
+        executor = Executor(workers=1, languages=())
+        executor.start()
+        try:
+            jobs = [asyncio.ensure_future(executor.run(time.sleep, 0.5)) for _ in range(6)]
+            await asyncio.sleep(0.1)
+            for job in jobs:
+                job.cancel()
+
+            # Only waits for the job which was already running
+            start_time = time.perf_counter()
+            await executor.run(time.sleep, 0)
+            self.assertLess(time.perf_counter() - start_time, 1)
+        finally:
+            executor.close()
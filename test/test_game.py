@@ -0,0 +1,147 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import aiounittest
+
+from herobrain.analysis import fingerprint
+from herobrain.game import GameHandler, frame_type
+
+
+class TestFrameType(unittest.TestCase):
+    def test_finds_type_without_decoding(self):
+        chat = json.dumps({"type": "interaction", "ts": "2018-06-19T14:11:02.525Z", "itemId": "chat",
+                           "metadata": {"message": "type", "interaction": "chat"}})
+        self.assertEqual(frame_type(chat), "interaction")
+        self.assertEqual(frame_type('{"type" : "question", "question": "Which?"}'), "question")
+
+    def test_no_type(self):
+        self.assertIsNone(frame_type('{"error": "Auth not valid"}'))
+        self.assertIsNone(frame_type('{"ts": "' + "x" * 200 + '", "type": "question"}'))
+
+
+class _Game(GameHandler):
+    def __init__(self):
+        super().__init__("wss://test", {}, None, None)
+        self.events = []
+
+    async def _on_new_round(self, question, choices, number, num_questions):
+        try:
+            await asyncio.sleep(0.05)
+            self.events.append(f"answered {number}")
+        except asyncio.CancelledError:
+            self.events.append(f"cancelled {number}")
+            raise
+
+    async def _on_round_complete(self, answer_counts, correct_answer, eliminated, advancing):
+        self.events.append("round over")
+
+
+def _question(number):
+    return {"type": "question", "question": "Which?", "answers": [{"text": "a"}, {"text": "b"}],
+            "questionNumber": number, "questionCount": 12}
+
+
+class TestScheduling(aiounittest.AsyncTestCase):
+    async def test_new_question_cancels_last(self):
+        game = _Game()
+        low_priority = asyncio.ensure_future(game._handle_low_priority_events())
+        try:
+            await game._schedule_event(_question(1))
+            await asyncio.sleep(0.01)
+            await game._schedule_event(_question(2))
+            await asyncio.sleep(0.01)
+            await game._schedule_event({"type": "questionSummary", "answerCounts": [],
+                                        "advancingPlayersCount": 1, "eliminatedPlayersCount": 1})
+            await asyncio.sleep(0.1)
+        finally:
+            low_priority.cancel()
+
+        # The summary cancels the second question too, and is only handled once it has stopped
+        self.assertEqual(game.events, ["cancelled 1", "cancelled 2", "round over"])
+
+    async def test_repeated_frames_ignored(self):
+        game = _Game()
+        summary = {"type": "questionSummary", "questionId": 10, "answerCounts": [],
+                   "advancingPlayersCount": 1, "eliminatedPlayersCount": 1}
+        low_priority = asyncio.ensure_future(game._handle_low_priority_events())
+        try:
+            await game._schedule_event(_question(1))
+            await asyncio.sleep(0.1)
+            # Frames sent again after reconnecting
+            await game._schedule_event(_question(1))
+            await game._schedule_event(summary)
+            await game._schedule_event(summary)
+            await asyncio.sleep(0.1)
+        finally:
+            low_priority.cancel()
+
+        self.assertEqual(game.events, ["answered 1", "round over"])
+
+    async def test_remembers_answer_of_cancelled_question(self):
+        game = _Game()
+        game._interface = mock.Mock()
+        game._memory = mock.Mock()
+        remembered = []
+
+        async def remember(*args, **kwargs):
+            remembered.append((args, kwargs))
+        game._memory.remember = remember
+
+        await game._schedule_event(_question(1))
+        await asyncio.sleep(0.01)
+        # The round ends before the analysis does
+        game._cancel_analysis()
+        await asyncio.wait([game._analysis_task])
+        await GameHandler._on_round_complete(game, {"a": 1, "b": 2}, "b", 1, 1)
+
+        self.assertEqual(game.events, ["cancelled 1"])
+        self.assertEqual(remembered, [((fingerprint("Which?", ["a", "b"]), {}, 0), {"correct": "b"})])
+
+    def test_reconnect_delay_backs_off(self):
+        game = _Game()
+        delays = [game._reconnect_delay() for _ in range(8)]
+        self.assertLessEqual(delays[0], GameHandler.FIRST_RECONNECT_DELAY)
+        self.assertTrue(all(delay <= GameHandler.MAX_RECONNECT_DELAY for delay in delays))
+        self.assertGreater(delays[-1], GameHandler.FIRST_RECONNECT_DELAY)
+
+        game._disconnected_time -= GameHandler.RECONNECT_TIMEOUT + 1
+        self.assertIsNone(game._reconnect_delay())
+
+    def test_dropped_connections_keep_backing_off(self):
+        game = _Game()
+        game._reconnect_delay()
+        # Accepted, then dropped straight away
+        game._on_connected()
+        game._reconnect_delay()
+        self.assertEqual(game._reconnect_attempts, 2)
+
+        game._disconnected_time -= GameHandler.RECONNECT_TIMEOUT + 1
+        game._on_connected()
+        self.assertIsNone(game._reconnect_delay())
+
+    def test_working_connection_resets_backoff(self):
+        game = _Game()
+        game._reconnect_delay()
+        game._on_connected()
+        game._connected_time -= GameHandler.STABLE_CONNECTION_SECONDS
+        game._reconnect_delay()
+        self.assertEqual(game._reconnect_attempts, 1)
+
+        game._on_connected()
+        game._on_connection_working()
+        self.assertIsNone(game._disconnected_time)
+        self.assertEqual(game._reconnect_attempts, 0)
+
+    def test_reconnects_bounded(self):
+        game = _Game()
+        for _ in range(GameHandler.MAX_RECONNECTS):
+            self.assertIsNotNone(game._reconnect_delay())
+            game._on_connected()
+            game._on_connection_working()
+        self.assertIsNone(game._reconnect_delay())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import tempfile
+
+import aiounittest
+
+from herobrain.analysis import fingerprint
+from herobrain.memory import AnswerMemory
+
+
+class TestAnswerMemory(aiounittest.AsyncTestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_fingerprint_is_normalised(self):
+        self.assertEqual(fingerprint("Which of these is a “fruit”?", ["Apple", "Leek's stem"]),
+                         fingerprint("which of these is a fruit", ["leeks stem", "apple"]))
+        self.assertNotEqual(fingerprint("Which of these is a fruit?", ["Apple", "Leek"]),
+                            fingerprint("Which of these is a fruit?", ["Apple", "Carrot"]))
+
+    async def test_recalls_prediction(self):
+        memory = AnswerMemory(self._dir.name)
+        key = fingerprint("Which?", ["A", "B"])
+        self.assertIsNone(await memory.recall(key, ["A", "B"]))
+
+        await memory.remember(key, {"A": 0.7, "B": 0.3}, 0.5)
+
+        self.assertEqual(await AnswerMemory(self._dir.name).recall(key, ["b", "a"]), ({"b": 0.3, "a": 0.7}, 0.5))
+
+    async def test_recalls_correct_answer(self):
+        memory = AnswerMemory(self._dir.name)
+        key = fingerprint("Which?", ["A", "B"])
+
+        await memory.remember(key, {"A": 0.7, "B": 0.3}, 0.5, correct="B")
+
+        self.assertEqual(await memory.recall(key, ["A", "B"]), ({"A": 0, "B": 1}, 1))
@@ -0,0 +1,40 @@
+import unittest
+
+from herobrain import metrics
+from herobrain.tracing import Trace
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_exposition(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram("test_seconds", "Test", buckets=(0.1, 1))
+        histogram.observe(0.05, stage="a")
+        histogram.observe(0.5, stage="a")
+
+        lines = registry.expose().splitlines()
+        self.assertIn('test_seconds_bucket{stage="a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_count{stage="a"} 2', lines)
+
+    def test_observe_trace(self):
+        trace = Trace()
+        trace.add("search", 0, 0.2)
+        trace.add("fetch", 0, 0.1, url="a", status=200, bytes=100)
+        trace.add("fetch", 0, 0.3, url="b", error="TimeoutError", bytes=0)
+
+        stages = metrics.registry.histogram("herobrain_stage_seconds", "")
+        fetches = metrics.registry.counter("herobrain_fetches_total", "")
+        searches = stages.count(stage="search")
+        ok = fetches.get(status=200)
+
+        metrics.observe_trace(trace)
+
+        self.assertEqual(stages.count(stage="search"), searches + 1)
+        self.assertEqual(fetches.get(status=200), ok + 1)
+        self.assertEqual(fetches.get(status="TimeoutError"), 1)
+        self.assertEqual(trace.to_dict()["stages"]["fetch"], 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import unittest
+
+import aiounittest
+from aiohttp import web
+
+from herobrain import networking
+from herobrain.deadline import Deadline
+from herobrain.tracing import Trace
+
+
+class TestClient(unittest.TestCase):
+    def test_new_loop_closes_last_session(self):
+        client = networking.Client()
+
+        async def open_session():
+            return client.session
+
+        last_loop = asyncio.get_event_loop()
+        sessions = []
+        try:
+            for _ in range(2):
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                sessions.append(loop.run_until_complete(open_session()))
+
+            self.assertIsNot(sessions[0], sessions[1])
+            self.assertTrue(sessions[0].closed)
+            loop.run_until_complete(client.close())
+        finally:
+            asyncio.set_event_loop(last_loop)
+
+
+class TestGetResponses(aiounittest.AsyncTestCase):
+    DELAYS = [0, 0, 0.05, 2]
+
+    def setUp(self):
+        self._client = networking.get_client()
+        networking.set_client(networking.Client())
+
+    def tearDown(self):
+        networking.set_client(self._client)
+
+    async def _start_server(self):
+        async def handle(request):
+            delay = float(request.match_info["delay"])
+            await asyncio.sleep(delay)
+            return web.Response(text=request.match_info["delay"])
+
+        async def handle_text(request):
+            return web.Response(text="café")
+
+        app = web.Application()
+        app.router.add_get("/text/cafe", handle_text)
+        app.router.add_get("/{delay}", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, [f"http://127.0.0.1:{port}/{delay}" for delay in TestGetResponses.DELAYS]
+
+    async def test_quorum(self):
+        runner, urls = await self._start_server()
+        try:
+            responses = await networking.get_responses(urls, 10, {}, quorum=3)
+            self.assertEqual(responses, ["0", "0", "0.05", ""])
+        finally:
+            await networking.get_client().close()
+            await runner.cleanup()
+
+    async def test_deadline(self):
+        runner, urls = await self._start_server()
+        try:
+            deadline = Deadline(0.5)
+            responses = await networking.get_responses(urls, 10, {}, deadline=deadline)
+            self.assertEqual(responses, ["0", "0", "0.05", ""])
+            self.assertLess(asyncio.get_event_loop().time(), deadline.end + 0.5)
+        finally:
+            await networking.get_client().close()
+            await runner.cleanup()
+
+    async def test_on_response(self):
+        async def respond(delay, response):
+            await asyncio.sleep(delay)
+            return response
+
+        arrived = []
+        responses = await networking.gather_responses([respond(0.02, "a"), respond(0, ""), respond(0.01, "c")],
+                                                      on_response=lambda index, response: arrived.append(index))
+        self.assertEqual(responses, ["a", "", "c"])
+        self.assertEqual(arrived, [2, 0])
+
+
+    async def test_hedged_request(self):
+        runner, urls = await self._start_server()
+        try:
+            for _ in range(networking.HEDGE_MIN_SAMPLES):
+                networking.latencies.add(urls[-1], 0.05)
+
+            # The slow request is hedged with a fast one, which answers first
+            start_time = asyncio.get_event_loop().time()
+            response = await networking.get_response(urls[-1], 10, {}, hedge_urls=[urls[0]])
+            self.assertEqual(response, "0")
+            self.assertLess(asyncio.get_event_loop().time() - start_time, 1)
+
+            # Each url is hedged with its own alternates
+            responses = await networking.get_responses(urls[2:], 10, {}, hedge_urls=[None, [urls[0]]])
+            self.assertEqual(responses, ["0.05", "0"])
+        finally:
+            await networking.get_client().close()
+            await runner.cleanup()
+
+    async def test_hedged_request_deadline(self):
+        runner, urls = await self._start_server()
+        try:
+            for _ in range(networking.HEDGE_MIN_SAMPLES):
+                networking.latencies.add(urls[-1], 0.3)
+
+            # Neither copy answers before the deadline, and the second starts close to it
+            deadline = Deadline(0.5)
+            response = await networking.get_response(urls[-1], 10, {}, deadline=deadline, hedge_urls=[urls[-1]])
+            self.assertEqual(response, "")
+            self.assertLess(asyncio.get_event_loop().time(), deadline.end + 0.1)
+        finally:
+            await networking.get_client().close()
+            await runner.cleanup()
+
+    async def test_traces_bytes_read(self):
+        runner, urls = await self._start_server()
+        try:
+            trace = Trace()
+            response = await networking.get_response(networking.origin(urls[0]) + "text/cafe", 10, {}, trace=trace)
+            self.assertEqual(response, "café")
+            self.assertEqual(trace.spans[0]["bytes"], len("café".encode("utf-8")))
+        finally:
+            await networking.get_client().close()
+            await runner.cleanup()
+
+    async def test_warm_connections(self):
+        runner, urls = await self._start_server()
+        try:
+            statuses = await networking.warm_connections([networking.origin(urls[0])] * 2 + ["http://127.0.0.1:1/"], 1)
+            self.assertEqual(statuses[2], None)
+            self.assertEqual(networking.origin(urls[0]), urls[0][:-1])
+        finally:
+            await networking.get_client().close()
+            await runner.cleanup()
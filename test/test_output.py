@@ -0,0 +1,75 @@
+import asyncio
+
+import aiounittest
+from aiohttp import web
+
+from herobrain import networking
+from herobrain import output
+from herobrain.output import HQHeroInterface
+
+
+async def _serve(handle):
+    app = web.Application()
+    app.router.add_post("/hero/{endpoint}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+class TestHQHeroInterface(aiounittest.AsyncTestCase):
+    async def test_delivers_in_order_and_coalesces(self):
+        received = []
+
+        async def handle(request):
+            received.append((request.path, await request.json()))
+            await asyncio.sleep(0.01)
+            return web.json_response({"success": True})
+
+        runner, port = await _serve(handle)
+
+        output.QUIET = True
+        interface = HQHeroInterface(f"http://127.0.0.1:{port}")
+        try:
+            for _ in range(5):
+                interface.report_waiting()
+            interface.report_starting()
+            interface.report_provisional_prediction(1, {"a": 0.6, "b": 0.4}, 0.1, 0.2)
+            interface.report_provisional_prediction(1, {"a": 0.7, "b": 0.3}, 0.2, 0.4)
+            await interface.close()
+        finally:
+            output.QUIET = False
+            await networking.get_client().close()
+            await runner.cleanup()
+
+        self.assertEqual([path for path, _ in received], [HQHeroInterface.WAITING,
+                                                          HQHeroInterface.STARTING,
+                                                          HQHeroInterface.PREDICTION])
+        self.assertEqual(received[-1][1]["info"]["prediction"]["confidence"], 0.2)
+
+    async def test_retries_failed_report(self):
+        received = []
+
+        async def handle(request):
+            received.append(request.path)
+            if len(received) == 1:
+                return web.json_response({"error": "Try again"})
+            return web.json_response({"success": True})
+
+        runner, port = await _serve(handle)
+
+        output.QUIET = True
+        interface = HQHeroInterface(f"http://127.0.0.1:{port}")
+        retry_delay = HQHeroInterface.RETRY_DELAY
+        HQHeroInterface.RETRY_DELAY = 0
+        try:
+            interface.report_starting()
+            await interface.close()
+        finally:
+            HQHeroInterface.RETRY_DELAY = retry_delay
+            output.QUIET = False
+            await networking.get_client().close()
+            await runner.cleanup()
+
+        self.assertEqual(received, [HQHeroInterface.STARTING, HQHeroInterface.STARTING])
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import tempfile
+
+import aiounittest
+from aiohttp import web
+
+from herobrain import networking
+from herobrain import search
+from herobrain.cache import PageCache
+from herobrain.counting import TermCounter
+from herobrain.recording import Recording, RecordingClient, ReplayClient
+
+
+class TestReplay(aiounittest.AsyncTestCase):
+    def setUp(self):
+        self._client = networking.get_client()
+        self._page_cache = search.page_cache
+        search.page_cache = PageCache()
+
+    def tearDown(self):
+        networking.set_client(self._client)
+        search.page_cache = self._page_cache
+
+    def test_save_and_load(self):
+        recording = Recording({"type": "question", "questionNumber": 1}, "en-uk")
+        recording.add("http://a", "utf-8", "<p>café</p>".encode("utf-8"))
+        recording.add("http://b", "iso-8859-1", "<p>café</p>".encode("iso-8859-1"))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "1.json.gz")
+            recording.save(path)
+            loaded = Recording.load(path)
+
+        self.assertEqual(loaded.message, recording.message)
+        self.assertEqual(loaded.language, "en-uk")
+        self.assertEqual({url: body.decode(charset) for url, (charset, body) in loaded.responses.items()},
+                         {"http://a": "<p>café</p>", "http://b": "<p>café</p>"})
+
+    async def test_replays_without_network(self):
+        recording = Recording({}, "en-uk")
+        recording.add("http://a", "utf-8", b"<p>The Eiffel Tower</p>")
+        networking.set_client(ReplayClient(recording))
+
+        texts = await search.get_clean_texts(["http://a", "http://not-recorded"])
+
+        self.assertEqual([page.text() for page in texts], ["the eiffel tower", ""])
+
+    async def test_counts_each_page_once(self):
+        recording = Recording({}, "en-uk")
+        recording.add("http://a", "utf-8", b"<p>The Eiffel Tower, Paris</p>")
+        networking.set_client(ReplayClient(recording))
+
+        counts = []
+        counter = TermCounter(["eiffel tower", "paris", "london"])
+        for _ in range(2):
+            # The second time the page comes from the cache
+            await search.get_clean_texts(["http://a", "http://not-recorded"], counter=counter,
+                                         on_counts=lambda index, page_counts: counts.append((index, page_counts)))
+
+        self.assertEqual(counts, [(0, {"eiffel tower": 1, "paris": 1, "london": 0})] * 2)
+
+
+class TestRecordingClient(aiounittest.AsyncTestCase):
+    def setUp(self):
+        self._client = networking.get_client()
+
+    def tearDown(self):
+        networking.set_client(self._client)
+
+    async def test_records_only_complete_responses(self):
+        async def handle(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            for _ in range(10):
+                await response.write(b"<p>paris</p>")
+                await asyncio.sleep(0.01)
+            return response
+
+        app = web.Application()
+        app.router.add_get("/", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/"
+
+        with tempfile.TemporaryDirectory() as directory:
+            client = RecordingClient(directory)
+            networking.set_client(client)
+            client.start({}, "en-uk")
+            try:
+                self.assertEqual(await networking.get_response(url, 10, {}, max_bytes=1024), "<p>paris</p>" * 10)
+
+                # A request which is given up on part of the way through
+                request = asyncio.ensure_future(networking.get_response(url, 10, {}, max_bytes=1024))
+                await asyncio.sleep(0.05)
+                request.cancel()
+                await asyncio.wait([request])
+
+                self.assertEqual(bytes(client.recording.responses[url][1]), b"<p>paris</p>" * 10)
+            finally:
+                await client.stop()
+                await client.close()
+                await runner.cleanup()
@@ -0,0 +1,95 @@
+import json
+import tempfile
+import unittest
+
+import aiounittest
+
+from herobrain import localisation
+from herobrain import search
+from herobrain.store import DiskStore
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+  <title>The Eiffel Tower &amp; Paris</title>
+  <style type="text/css">body { color: red; }</style>
+  <script>var tag = "<b>not text</b>";</script>
+</head>
+<body>
+  <!-- a comment with a > in it -->
+  <p>The Eiffel&nbsp;Tower is in <b>Paris</b>, France.</p>
+  <SCRIPT type="text/javascript">if (a < b) { c(); }</SCRIPT>
+  <p>It cost $1.5 million &mdash; caf&eacute; C++ "quoted"</p>
+</body>
+</html>
+"""
+
+WORDS = "the eiffel tower paris the eiffel tower is in paris france it cost 15 million cafe c quoted"
+
+
+class TestTextExtractor(unittest.TestCase):
+    def test_clean_html(self):
+        self.assertEqual(search.clean_html(PAGE).text(), WORDS)
+
+    def test_any_chunk_size(self):
+        for chunk_size in (1, 2, 3, 7, 64):
+            extractor = search.TextExtractor()
+            for i in range(0, len(PAGE), chunk_size):
+                extractor.feed(PAGE[i:i + chunk_size])
+
+            self.assertEqual(extractor.close().text(), WORDS, f"chunk size {chunk_size}")
+
+
+SERP = """<html><body>
+<div class="g"><div class="rc"><div class="r"><a href="https://en.wikipedia.org/wiki/Paris" ping="/url?x=1"><h3>Paris</h3></a></div></div></div>
+<div class="g"><div class="r"><span>Ad</span> <a class="l" href="https://example.com/?a=1&amp;b=2">Example</a></div></div>
+<div class="g"><div class="r"></div></div>
+<div class="g"><div class='r s'><a href="https://en.wikipedia.org/wiki/Paris">Paris again</a></div></div>
+<div class="g"><div class="r"><a href="https://www.britannica.com/place/Paris">Britannica</a></div></div>
+<div class="g"><div class="r"><a href="https://www.paris.fr/">Paris.fr</a></div></div>
+</body></html>
+"""
+
+
+class TestGoogleLinks(unittest.TestCase):
+    def test_same_links_as_parsing(self):
+        for num_results in range(5):
+            self.assertEqual(search.get_google_links(SERP, num_results),
+                             search._parse_google_links(SERP, num_results))
+
+    def test_only_links_inside_results(self):
+        page = """<html><body>
+<div class="g"><div class="r"><div><span>No link</span></div></div><a href="https://example.com/footer">Footer</a></div>
+<div class="g"><div class="r"><div><div>Nested</div> <a href="https://en.wikipedia.org/wiki/Paris">Paris</a></div></div></div>
+<div class="g"><div class="r"><span>Ad</span></div> <a href="https://example.com/after">After</a></div>
+</body></html>
+"""
+        for num_results in range(4):
+            self.assertEqual(search._scan_google_links(page, num_results),
+                             search._parse_google_links(page, num_results))
+        self.assertEqual(search._scan_google_links(page, 5), ["https://en.wikipedia.org/wiki/Paris"])
+
+    def test_falls_back_to_parsing(self):
+        page = '<div class=r><a href="https://en.wikipedia.org/wiki/Paris">Paris</a></div>'
+
+        self.assertEqual(search._scan_google_links(page, 5), [])
+        self.assertEqual(search.get_google_links(page, 5), ["https://en.wikipedia.org/wiki/Paris"])
+
+
+class TestStore(aiounittest.AsyncTestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        search.set_store(DiskStore(self._dir.name))
+
+    def tearDown(self):
+        search.set_store(None)
+        self._dir.cleanup()
+
+    async def test_loads_stored_links(self):
+        locale = localisation.get_locale()
+        links = ["https://en.wikipedia.org/wiki/Paris", "https://www.paris.fr/"]
+        search._store.put(f"serp:2:{locale.google_url.format('paris')}", json.dumps(links))
+
+        # Stored links are used without searching
+        self.assertEqual(await search.search_google("paris", 2, locale), links)
+        self.assertIsNone(await search._load_page("http://not-stored"))
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from herobrain.store import DiskStore
+
+
+class TestDiskStore(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_stores_between_instances(self):
+        DiskStore(self._dir.name).put("page:http://a", "some text " * 100)
+        store = DiskStore(self._dir.name)
+
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get("page:http://a"), "some text " * 100)
+        self.assertIsNone(store.get("page:http://b"))
+
+    def test_compresses(self):
+        store = DiskStore(self._dir.name)
+        store.put("key", "a" * 10000)
+
+        self.assertLess(store.size, 1000)
+
+    def test_evicts_least_recently_used(self):
+        store = DiskStore(self._dir.name)
+        store.put("1", "a")
+        value_size = store.size
+
+        store = DiskStore(self._dir.name, max_size=value_size * 2)
+        store.put("2", "b")
+        store.get("1")
+        store.put("3", "c")
+
+        self.assertEqual(store.get("1"), "a")
+        self.assertIsNone(store.get("2"))
+        self.assertEqual(store.get("3"), "c")
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self._dir.name)), 2)
+
+    def test_expires(self):
+        store = DiskStore(self._dir.name, ttl=-1)
+        store.put("1", "a")
+
+        self.assertIsNone(store.get("1"))
+        self.assertEqual(len(store), 0)